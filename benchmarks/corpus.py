@@ -0,0 +1,81 @@
+"""
+Synthetic OCR texts shaped like carrier quote packets, for benchmarking.
+
+Every carrier recognised by detect_company gets quotes with 1-50 vehicles.
+Line order is shuffled locally the way Textract reorders table cells, and
+disclosure filler pads each quote to a realistic multi-page length.
+Generation is deterministic for a given seed.
+"""
+import random
+from typing import List, Tuple
+
+CARRIERS = [
+    "Progressive", "Travelers", "Allstate", "Geico",
+    "Liberty Mutual", "Safeco", "State Farm", "Nationwide",
+]
+VEHICLE_COUNTS = [1, 2, 5, 10, 25, 50]
+
+_VIN_CHARS = "ABCDEFGHJKLMNPRSTUVWXYZ0123456789"
+_MAKES = ["TOYOTA CAMRY LE", "HONDA ACCORD SPORT", "FORD F150 XLT", "TESLA MODEL 3", "NISSAN ALTIMA S", "CHEVROLET SILVERADO"]
+_FILLER = [
+    "This quote is not a contract of insurance and coverage is subject to underwriting review.",
+    "Rates are based on information provided and may change upon verification of driving records.",
+    "Signature of applicant ______________________ Date __________",
+    "Page {page} of {pages}",
+    "Please review the disclosures and notices included with this quote.",
+    "Discounts applied may include multi-policy, paperless and paid in full savings of $125.00",
+]
+
+
+def _vin(rng: random.Random) -> str:
+    return "".join(rng.choice(_VIN_CHARS) for _ in range(17))
+
+
+def _jumble(rng: random.Random, lines: List[str], reach: int = 2) -> List[str]:
+    # swap neighbours within a small window, like OCR reading order on tables
+    out = list(lines)
+    for i in range(len(out)):
+        j = min(len(out) - 1, i + rng.randint(0, reach))
+        if rng.random() < 0.3:
+            out[i], out[j] = out[j], out[i]
+    return out
+
+
+def make_quote(carrier: str, n_vehicles: int, seed: int = 0, filler_pages: int = 8) -> str:
+    rng = random.Random(f"{carrier}:{n_vehicles}:{seed}")
+    lines = [f"{carrier} Insurance Company", "Auto Insurance Quote", "Policy Term: 6 months"]
+    lines += [rng.choice(_FILLER[:3]) for _ in range(10)]
+    lines += ["Coverages"] + _jumble(rng, [
+        "Bodily Injury Liability", "$30,000/$60,000", "$213.40",
+        "Property Damage Liability", "25,000", "$180.22",
+        "Uninsured/Underinsured Motorist Bodily Injury", "30,000/60,000", "$61.10",
+        "Uninsured Motorist Property Damage", "25,000", "$20.33",
+        "Medical Payments", "$5,000", "$18.00",
+        "Personal Injury Protection", "$2,500", "$44.10",
+    ]) + ["TOTAL PER VEHICLE", "$537.15"]
+    for v in range(n_vehicles):
+        year = rng.randint(2008, 2025)
+        lines += _jumble(rng, [
+            f"{year} {rng.choice(_MAKES)}",
+            f"VIN: {_vin(rng)}",
+            "Comprehensive", f"{rng.choice(['250', '500', '1,000'])}", "$88.12",
+            "Collision", f"{rng.choice(['500', '1,000'])}", "$241.09",
+            "30/900", "Rental Reimbursement", "$22.00",
+            "Roadside Assistance", "$9.80",
+        ], reach=1)
+    lines += ["Vehicle Quote Details", "Discounts", "Taxes and Fees"]
+    pif = rng.randint(900, 4000) + rng.random()
+    lines += [
+        "Total 6 month policy premium", f"${pif:,.2f}",
+        "Estimated pay-in-full", f"${pif * 0.93:,.2f}",
+        "Monthly payments", f"${pif / 6 + 12:,.2f}", "Down payment", f"${pif / 6:,.2f}",
+    ]
+    for page in range(filler_pages):
+        for _ in range(40):
+            lines.append(rng.choice(_FILLER).format(page=page + 2, pages=filler_pages + 1))
+    return "\n".join(lines)
+
+
+def build_corpus(seed: int = 0, counts: List[int] = VEHICLE_COUNTS) -> List[Tuple[str, int, str]]:
+    """[(carrier, vehicle count, text)] for every carrier x vehicle count."""
+    return [(c, n, make_quote(c, n, seed)) for c in CARRIERS for n in counts]
@@ -0,0 +1,73 @@
+"""
+Cold-start import budget.
+
+    python -m benchmarks.imports                  # print report
+    python -m benchmarks.imports --budget-ms 200  # exit 1 over budget or on a heavy import
+
+Every module is imported in a fresh interpreter (best of --repeat runs) and
+must stay under the budget without loading any of the heavy dependencies
+listed for it. Those are imported on first use, so text-only parsing, batch
+subprocesses and the service pay for them only when they need them.
+"""
+import argparse
+import json
+import subprocess
+import sys
+from typing import Any, Dict, List, Tuple
+
+HEAVY = ("fitz", "pymupdf", "PIL", "boto3", "botocore", "docx", "lxml")
+
+# module -> heavy modules it may load at import
+MODULES: Dict[str, Tuple[str, ...]] = {
+    "utils.parse_quote": (),
+    "utils.parse_cache": (),
+    "utils.quote_model": (),
+    "utils.batch": (),
+    "utils.service": (),
+    "utils.generate_policy": ("docx", "lxml"),
+}
+
+_PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import {module}
+ms = (time.perf_counter() - t) * 1000
+print(json.dumps({{"ms": ms, "loaded": sorted({{m.split(".")[0] for m in sys.modules}} & set({heavy!r}))}}))
+"""
+
+
+def measure(module: str, repeat: int = 3) -> Dict[str, Any]:
+    best: Dict[str, Any] = {}
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-W", "ignore", "-c", _PROBE.format(module=module, heavy=HEAVY)],
+                             capture_output=True, text=True, check=True).stdout
+        run = json.loads(out.strip().splitlines()[-1])
+        if not best or run["ms"] < best["ms"]:
+            best = run
+    return best
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Check import time and lazy heavy dependencies")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--budget-ms", type=float, default=250.0, help="per-module import budget")
+    args = ap.parse_args(argv)
+
+    failures: List[str] = []
+    print(f"{'module':<24}{'import ms':>10}  heavy modules loaded")
+    for module, allowed in MODULES.items():
+        r = measure(module, args.repeat)
+        extra = [m for m in r["loaded"] if m not in allowed]
+        print(f"{module:<24}{r['ms']:>10.1f}  {', '.join(r['loaded']) or '-'}")
+        if r["ms"] > args.budget_ms:
+            failures.append(f"{module} {r['ms']:.0f} ms")
+        if extra:
+            failures.append(f"{module} imports {', '.join(extra)}")
+    if failures:
+        print(f"over budget ({args.budget_ms:.0f} ms) or eager: {'; '.join(failures)}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+"""
+End-to-end benchmark of the quote parser and the policy renderer.
+
+    python -m benchmarks.run                          # print report
+    python -m benchmarks.run --save-baseline base.json
+    python -m benchmarks.run --baseline base.json     # exit 1 on regression
+
+Each extractor is timed on every synthetic quote with the shared line index
+cleared first, so it pays for its own tokenizing as it would running alone.
+parse_quote_text and render_policy_docx time the full pipeline stages.
+Peak memory is measured in a separate tracemalloc pass so it does not skew
+the latencies.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from benchmarks.corpus import build_corpus
+from utils import parse_quote as pq
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "template", "保单范例.docx")
+
+
+def _cold(fn: Callable[[str], Any]) -> Callable[[str], Any]:
+    def run(text: str):
+        pq._line_index.cache_clear()
+        return fn(text)
+    return run
+
+
+def _linear(text: str):
+    return pq._parse_coverages_linear(pq._coverages_block_lines(text))
+
+
+TEXT_BENCHES: Dict[str, Callable[[str], Any]] = {
+    "detect_company": _cold(pq.detect_company),
+    "extract_total_premium": _cold(pq.extract_total_premium),
+    "extract_policy_term": _cold(pq.extract_policy_term),
+    "extract_liability": _cold(pq.extract_liability),
+    "extract_uninsured_motorist": _cold(pq.extract_uninsured_motorist),
+    "extract_medical_payment": _cold(pq.extract_medical_payment),
+    "extract_personal_injury": _cold(pq.extract_personal_injury),
+    "extract_vehicles": _cold(pq.extract_vehicles),
+    "_parse_coverages_linear": _cold(_linear),
+    "parse_quote_text": _cold(pq.parse_quote_text),
+}
+
+
+def _percentile(sorted_vals: List[float], q: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+    return sorted_vals[k]
+
+
+def _measure(fn: Callable[[Any], Any], inputs: List[Any], repeat: int) -> Dict[str, float]:
+    lat: List[float] = []
+    total_start = time.perf_counter()
+    for _ in range(repeat):
+        for item in inputs:
+            t = time.perf_counter()
+            fn(item)
+            lat.append(time.perf_counter() - t)
+    total = time.perf_counter() - total_start
+    lat.sort()
+
+    tracemalloc.start()
+    for item in inputs:
+        fn(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "calls": len(lat),
+        "throughput_per_s": len(lat) / total if total else 0.0,
+        "p50_ms": _percentile(lat, 0.50) * 1000,
+        "p99_ms": _percentile(lat, 0.99) * 1000,
+        "peak_kib": peak / 1024,
+    }
+
+
+def run_benchmarks(repeat: int = 3, seed: int = 0, render: bool = True) -> Dict[str, Any]:
+    corpus = build_corpus(seed)
+    texts = [t for _, _, t in corpus]
+    results: Dict[str, Dict[str, float]] = {}
+    for name, fn in TEXT_BENCHES.items():
+        results[name] = _measure(fn, texts, repeat)
+
+    if render:
+        from utils.generate_policy import render_policy_docx
+        from utils.templates import load_template
+        datas = [pq.parse_quote_text(t) for t in texts]
+        results["generate_policy_docx"] = _measure(
+            lambda d: render_policy_docx(load_template(TEMPLATE), copy.deepcopy(d)), datas, max(1, repeat // 3))
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "quotes": len(texts),
+            "lines_total": sum(t.count("\n") + 1 for t in texts),
+            "repeat": repeat,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Names whose p50 grew by more than ``tolerance`` (fraction) over the baseline."""
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("p50_ms"):
+            continue
+        if cur["p50_ms"] > base["p50_ms"] * (1 + tolerance):
+            regressions.append(name)
+    return regressions
+
+
+def format_report(report: Dict[str, Any], baseline: Dict[str, Any] = None) -> str:
+    rows = [f"{'benchmark':<28}{'calls':>7}{'ops/s':>11}{'p50 ms':>10}{'p99 ms':>10}{'peak KiB':>11}{'vs base':>9}"]
+    for name, r in report["results"].items():
+        delta = ""
+        base = (baseline or {}).get("results", {}).get(name)
+        if base and base.get("p50_ms"):
+            delta = f"{(r['p50_ms'] / base['p50_ms'] - 1) * 100:+.0f}%"
+        rows.append(
+            f"{name:<28}{r['calls']:>7}{r['throughput_per_s']:>11.1f}{r['p50_ms']:>10.3f}"
+            f"{r['p99_ms']:>10.3f}{r['peak_kib']:>11.1f}{delta:>9}"
+        )
+    return "\n".join(rows)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark quote parsing and policy rendering")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--no-render", action="store_true", help="skip generate_policy_docx")
+    ap.add_argument("--json", help="write the full report to this file")
+    ap.add_argument("--baseline", help="compare against a stored report")
+    ap.add_argument("--save-baseline", help="store this run as a baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="allowed p50 slowdown (0.25 = 25%%)")
+    args = ap.parse_args(argv)
+
+    report = run_benchmarks(args.repeat, args.seed, render=not args.no_render)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print(format_report(report, baseline))
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"regressions over {args.tolerance:.0%}: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
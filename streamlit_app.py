@@ -1,12 +1,48 @@
-import streamlit as st
-from docx import Document
-import tempfile
-from utils.parse_quote import extract_quote_data
-from utils.generate_policy import generate_policy_docx  # 确保此函数已支持多车辆
+import hashlib
 import os
+import time
+
+import streamlit as st
+from utils.jobs import JobStore
 
 TEMPLATE_PATH = "template/保单范例.docx"
 
+# 后台任务的阶段 -> 进度条上的说明
+STAGES = {
+    "ocr": "正在识别报价内容（OCR）",
+    "parse": "正在解析保障项目",
+    "render": "正在生成中文保单",
+}
+POLL_SECONDS = 0.5
+
+
+@st.cache_resource
+def job_store() -> JobStore:
+    # 所有会话共用一个任务池：同一个文件只识别一次，之后的重跑（下载、展开原文）直接取结果
+    return JobStore(workers=2)
+
+
+def build_policy(file_bytes: bytes, progress) -> dict:
+    # python-docx / PyMuPDF 只在真正生成保单时才导入；还没上传文件时的冷启动和重跑都不加载它们
+    from utils.generate_policy import render_policy_docx  # 确保此函数已支持多车辆
+    from utils.parse_quote import parse_quote_cached, read_quote
+    from utils.templates import load_template
+
+    # 1. 从 Textract 提取 OCR 文本（有文字层的 PDF 页直接读取）
+    progress("ocr")
+    quote = read_quote(file_bytes)
+
+    # 2. 解析字段（按文本哈希缓存）
+    progress("parse")
+    data = parse_quote_cached(quote.text, quote.layout)
+    data.skipped_pages = list(quote.skipped_pages)
+
+    # 3. 加载 Word 模板（解析结果缓存，每次拿副本），生成中文保单（支持多车辆），直接写进内存
+    progress("render")
+    docx = render_policy_docx(load_template(TEMPLATE_PATH), data).getvalue()
+    return {"data": data.to_dict(), "ocr_text": quote.text, "docx": docx}
+
+
 st.set_page_config(page_title="中文保单生成器", layout="centered")
 
 st.title("📄 中文保单生成器")
@@ -15,33 +51,39 @@ st.markdown("上传保险报价 PDF 或图片，系统将自动生成中文保
 uploaded_file = st.file_uploader("请上传报价文件（PDF / JPG / PNG）", type=["pdf", "jpg", "jpeg", "png"])
 
 if uploaded_file:
-    with st.spinner("正在识别报价内容，请稍候..."):
-        try:
-            # 1. 从 Textract 提取数据和 OCR 文本
-            data, ocr_text = extract_quote_data(uploaded_file, return_raw_text=True)
-
-            # 2. 加载 Word 模板
-            template_doc = Document(TEMPLATE_PATH)
-
-            # 3. 生成中文保单（支持多车辆）
-            generate_policy_docx(template_doc, data)
-
-            # 4. 保存为临时文件
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-                output_path = tmp.name
-                template_doc.save(output_path)
+    file_bytes = uploaded_file.getvalue()
+    # 文件内容 + 模板版本决定结果；换模板会重新生成
+    key = f"{hashlib.sha256(file_bytes).hexdigest()}:{os.stat(TEMPLATE_PATH).st_mtime_ns}"
+    store = job_store()
+    job = store.submit(key, lambda progress: build_policy(file_bytes, progress))
 
-            # 5. 成功提示 + 下载按钮
-            st.success("✅ 保单生成成功！")
-            st.download_button("📥 下载生成的中文保单", data=open(output_path, "rb"), file_name="中文保单.docx")
+    if not job.done:
+        # 任务在后台线程里跑，这里只显示进度，过一会儿重跑脚本再看一次
+        names = list(STAGES)
+        step = names.index(job.stage) if job.stage in STAGES else 0
+        st.progress(step / len(names), text=STAGES.get(job.stage, "排队中，请稍候..."))
+        time.sleep(POLL_SECONDS)
+        st.rerun()
+    elif job.error:
+        st.error(f"❌ 出错了：{job.error}")
+        if st.button("🔁 重试"):
+            store.retry(key, lambda progress: build_policy(file_bytes, progress))
+            st.rerun()
+    else:
+        result = job.result
+        data = result["data"]
 
-            # 6. 显示字段提取结果（调试或验证用）
-            st.subheader("📋 提取字段预览")
-            st.json(data)
+        # 成功提示 + 下载按钮（点击下载只会重跑脚本取缓存结果，不会重新 OCR）
+        st.success("✅ 保单生成成功！")
+        if data.get("skipped_pages"):
+            pages = "、".join(str(p["page"]) for p in data["skipped_pages"])
+            st.caption(f"第 {pages} 页是空白页或条款说明，未做 OCR。")
+        st.download_button("📥 下载生成的中文保单", data=result["docx"], file_name="中文保单.docx")
 
-            # 7. 展示 OCR 原文（可折叠）
-            with st.expander("🧾 OCR 原始文本（调试用）"):
-                st.text(ocr_text)
+        # 显示字段提取结果（调试或验证用）
+        st.subheader("📋 提取字段预览")
+        st.json(data)
 
-        except Exception as e:
-            st.error(f"❌ 出错了：{e}")
+        # 展示 OCR 原文（可折叠）
+        with st.expander("🧾 OCR 原始文本（调试用）"):
+            st.text(result["ocr_text"])
@@ -0,0 +1,151 @@
+"""
+批量生成中文保单（无界面）。
+
+    python -m utils.batch quotes/ -o out/ --workers 8
+    python -m utils.batch manifest.txt -o out/
+
+输入可以是报价文件目录，或每行一个文件路径的清单（相对路径以清单所在目录为准）。
+每个输入在输出目录写出 <name>.docx 和 <name>.json；不同输入同名时（a/quote.pdf 和 b/quote.pdf，
+或 quote.pdf 和 quote.png），后面的依次写成 <name>-2、<name>-3 ……，并打印提示。
+"""
+import argparse
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+from utils import metrics
+
+QUOTE_EXTS = (".pdf", ".jpg", ".jpeg", ".png")
+DEFAULT_TEMPLATE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "template", "保单范例.docx")
+
+
+def collect_inputs(source: str) -> List[str]:
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.lower().endswith(QUOTE_EXTS)
+        )
+    base = os.path.dirname(os.path.abspath(source))
+    paths = []
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            paths.append(line if os.path.isabs(line) else os.path.join(base, line))
+    return paths
+
+
+def _output_stem(path: str, out_dir: str) -> str:
+    return os.path.join(out_dir, os.path.splitext(os.path.basename(path))[0])
+
+
+def output_stems(paths: List[str], out_dir: str) -> List[str]:
+    """每个输入的输出路径（不含扩展名），保证互不相同；重名的加 -2、-3 后缀。"""
+    stems = []
+    taken = set()  # 按小写比较，大小写不敏感的文件系统上 Quote 和 quote 也是同一个文件
+    for path in paths:
+        base = stem = _output_stem(path, out_dir)
+        n = 1
+        while stem.lower() in taken:
+            n += 1
+            stem = f"{base}-{n}"
+        if n > 1:
+            print(f"⚠️ {path}: 输出重名，改写到 {os.path.basename(stem)}.docx / .json", file=sys.stderr)
+        taken.add(stem.lower())
+        stems.append(stem)
+    return stems
+
+
+def process_quote(path: str, out_dir: str, template_path: str = DEFAULT_TEMPLATE,
+                  use_text_layer: bool = True, ocr_mode: str = "",
+                  skip_pages: bool = True, use_layout: bool = True, stem: str = "") -> Dict[str, Any]:
+    """stem 是输出路径（不含扩展名）；不给时按输入文件名取，批量时由 output_stems 分配。"""
+    from utils.parse_quote import extract_quote_data
+    from utils.generate_policy import render_policy_docx
+    from utils.templates import load_template
+
+    stem = stem or _output_stem(path, out_dir)
+    result: Dict[str, Any] = {"source": path}
+    try:
+        data, ocr_text = extract_quote_data(
+            path, return_raw_text=True, use_text_layer=use_text_layer, ocr_mode=ocr_mode,
+            skip_pages=skip_pages, use_layout=use_layout)
+        doc = load_template(template_path)
+        with open(stem + ".docx", "wb") as f:
+            render_policy_docx(doc, data, f)
+        result.update({"ok": True, "docx": stem + ".docx", "data": data.to_dict(), "ocr_text": ocr_text})
+    except Exception as e:
+        result.update({"ok": False, "error": str(e), "traceback": traceback.format_exc()})
+    with open(stem + ".json", "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    return {"source": path, "ok": result["ok"], "error": result.get("error", "")}
+
+
+def _pool_task(*args) -> Dict[str, Any]:
+    # 子进程里的指标按任务取增量，交给主进程合并
+    summary = process_quote(*args)
+    if metrics.enabled():
+        summary["metrics"] = metrics.snapshot()
+        metrics.reset()
+    return summary
+
+
+def run_batch(paths: List[str], out_dir: str, template_path: str = DEFAULT_TEMPLATE,
+              workers: int = 0, use_text_layer: bool = True, ocr_mode: str = "",
+              skip_pages: bool = True, use_layout: bool = True) -> List[Dict[str, Any]]:
+    os.makedirs(out_dir, exist_ok=True)
+    options = (use_text_layer, ocr_mode, skip_pages, use_layout)
+    stems = output_stems(paths, out_dir)
+    if workers == 1:
+        return [process_quote(p, out_dir, template_path, *options, stem) for p, stem in zip(paths, stems)]
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        futures = {pool.submit(_pool_task, p, out_dir, template_path, *options, stem): p
+                   for p, stem in zip(paths, stems)}
+        for fut in as_completed(futures):
+            try:
+                summary = fut.result()
+                metrics.merge(summary.pop("metrics", {}))
+                summaries.append(summary)
+            except Exception as e:  # worker process died
+                summaries.append({"source": futures[fut], "ok": False, "error": str(e)})
+    return summaries
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="批量把保险报价转换成中文保单 .docx")
+    ap.add_argument("source", help="报价文件目录，或每行一个路径的清单文件")
+    ap.add_argument("-o", "--out", required=True, help="输出目录")
+    ap.add_argument("-t", "--template", default=DEFAULT_TEMPLATE, help="Word 模板路径")
+    ap.add_argument("-w", "--workers", type=int, default=0, help="进程数（0 = CPU 核数，1 = 不用进程池）")
+    ap.add_argument("--ocr-only", action="store_true", help="忽略 PDF 文字层，所有页面都走 Textract")
+    ap.add_argument("--ocr-mode", choices=["analyze", "detect"], default="",
+                    help="analyze = 一次 AnalyzeDocument（含表格/表单），detect = 只识别文字；默认按保险公司选择")
+    ap.add_argument("--all-pages", action="store_true", help="不跳过空白页和条款页，每一页都识别")
+    ap.add_argument("--no-layout", action="store_true", help="只按行顺序找覆盖金额，不用页面坐标对齐")
+    ap.add_argument("--metrics", help="把各阶段耗时和计数以 Prometheus 文本格式写到这个文件")
+    args = ap.parse_args(argv)
+
+    if args.metrics:
+        os.environ["QUOTE_METRICS"] = "1"  # spawn 出来的子进程也打开
+        metrics.enable()
+
+    paths = collect_inputs(args.source)
+    summaries = run_batch(paths, args.out, args.template, args.workers, not args.ocr_only, args.ocr_mode,
+                          not args.all_pages, not args.no_layout)
+    failed = [s for s in summaries if not s["ok"]]
+    for s in failed:
+        print(f"❌ {s['source']}: {s['error']}", file=sys.stderr)
+    print(f"完成 {len(summaries) - len(failed)}/{len(summaries)}")
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(metrics.prometheus_text())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+"""
+批量生成保单：很多份报价一次输出成一个 zip（每份一个 .docx），或合并成一个 .docx（每份之间分页）。
+
+    python -m utils.bulk_render out/ -o policies.zip
+    python -m utils.bulk_render out/ -o mailing.docx --merged
+
+输入是 utils.batch 的输出目录（读取 ok 的 <name>.json），或每行一个解析结果的 .jsonl 文件。
+
+模板只保存一次：样式、主题、图片等部件的字节在所有保单之间共享，每份保单只重新序列化正文
+(word/document.xml)。输出边生成边写进流，一次只有一份保单在内存里。
+"""
+import argparse
+import copy
+import io
+import json
+import os
+import re
+import sys
+import zipfile
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Tuple, Union
+
+from docx.opc.oxml import serialize_part_xml
+from docx.oxml.ns import qn
+from lxml import etree
+
+from utils import metrics
+from utils.batch import DEFAULT_TEMPLATE
+from utils.generate_policy import generate_policy_docx
+from utils.quote_model import Quote
+from utils.templates import load_template
+
+DOCUMENT_XML = "word/document.xml"
+PAGE_BREAK = b'<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+QuoteData = Union[Quote, Dict[str, Any]]
+
+
+class TemplateParts:
+    """模板保存后的各个部件；除正文外原样复用。"""
+
+    def __init__(self, template_path: str = DEFAULT_TEMPLATE):
+        self.template_path = template_path
+        buf = io.BytesIO()
+        doc = load_template(template_path)
+        doc.save(buf)
+        self.entries: List[Tuple[zipfile.ZipInfo, bytes]] = []  # 正文之外的部件，保持原顺序
+        with zipfile.ZipFile(buf) as z:
+            for info in z.infolist():
+                if info.filename == DOCUMENT_XML:
+                    self.entries.append((info, b""))
+                    document = z.read(info)
+                else:
+                    self.entries.append((info, z.read(info)))
+        # 合并时：<w:document ...><w:body> + 每份正文 + 分节属性 + </w:body></w:document>
+        self.head = document[:re.search(rb"<w:body[^>]*>", document).end()]
+        self.tail = document[document.rindex(b"</w:body>"):]
+        sect_pr = doc.element.body.find(qn("w:sectPr"))
+        self.sect_pr = etree.tostring(sect_pr) if sect_pr is not None else b""
+        # 正文之外的部件只压缩这一次；每份保单在它后面追加自己的正文
+        base = io.BytesIO()
+        with zipfile.ZipFile(base, "w") as z:
+            for info, blob in self.entries:
+                if info.filename != DOCUMENT_XML:
+                    z.writestr(copy.copy(info), blob)
+        self.base = base.getvalue()
+        self.document_info = next(info for info, _ in self.entries if info.filename == DOCUMENT_XML)
+
+    def render(self, data: QuoteData):
+        """一份填好的模板副本（python-docx Document）。"""
+        doc = load_template(self.template_path)
+        with metrics.stage("generate_policy_docx"):
+            generate_policy_docx(doc, data)
+        return doc
+
+    def docx_bytes(self, data: QuoteData) -> bytes:
+        doc = self.render(data)
+        buf = io.BytesIO(self.base)
+        buf.seek(0, io.SEEK_END)
+        with metrics.stage("docx_save"):
+            with zipfile.ZipFile(buf, "a") as z:
+                # writestr 会改写 ZipInfo（偏移、CRC），每次写一个副本
+                z.writestr(copy.copy(self.document_info), serialize_part_xml(doc.element))
+        return buf.getvalue()
+
+
+def _unique_name(name: str, seen: Dict[str, int]) -> str:
+    stem = name[:-5] if name.lower().endswith(".docx") else name
+    n = seen.get(stem, 0) + 1
+    seen[stem] = n
+    return f"{stem}.docx" if n == 1 else f"{stem}-{n}.docx"
+
+
+def render_zip(items: Iterable[Tuple[str, QuoteData]], out: BinaryIO,
+               template_path: str = DEFAULT_TEMPLATE) -> int:
+    """
+    items 是 (文件名, 解析结果)；每份保单作为一个 .docx 写进 zip，重名自动加序号。
+    out 可以是不可 seek 的流。返回写入的份数。
+    """
+    parts = TemplateParts(template_path)
+    seen: Dict[str, int] = {}
+    count = 0
+    with zipfile.ZipFile(out, "w") as z:
+        for name, data in items:
+            # .docx 本身已经压缩过，在 zip 里原样存放
+            z.writestr(zipfile.ZipInfo(_unique_name(name, seen)), parts.docx_bytes(data))
+            count += 1
+    return count
+
+
+def render_merged(datas: Iterable[QuoteData], out: BinaryIO, template_path: str = DEFAULT_TEMPLATE) -> int:
+    """
+    所有保单合并成一个 .docx，每份之间插入分页符。正文直接写进 zip 里的 word/document.xml，
+    不会在内存里拼出整份文档。返回写入的份数。
+    """
+    parts = TemplateParts(template_path)
+    count = 0
+    drawing_id = 0
+    with zipfile.ZipFile(out, "w") as z:
+        for info, blob in parts.entries:
+            if info.filename != DOCUMENT_XML:
+                z.writestr(copy.copy(info), blob)
+                continue
+            entry = zipfile.ZipInfo(DOCUMENT_XML, info.date_time)
+            entry.compress_type = zipfile.ZIP_DEFLATED
+            with z.open(entry, "w", force_zip64=True) as f:
+                f.write(parts.head)
+                for data in datas:
+                    body = parts.render(data).element.body
+                    if count:
+                        f.write(PAGE_BREAK)
+                    for el in body:
+                        if el.tag == qn("w:sectPr"):
+                            continue
+                        # 图片的 docPr id 在整份文档里必须唯一
+                        for pr in el.iter(qn("wp:docPr")):
+                            drawing_id += 1
+                            pr.set("id", str(drawing_id))
+                        f.write(etree.tostring(el))
+                    count += 1
+                f.write(parts.sect_pr)
+                f.write(parts.tail)
+    return count
+
+
+def load_results(source: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """(名字, 解析结果)：batch 输出目录里成功的 .json，或 .jsonl 的每一行。"""
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(source, name), encoding="utf-8") as f:
+                result = json.load(f)
+            if result.get("ok") and result.get("data"):
+                yield name[:-5], result["data"]
+        return
+    with open(source, encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if line:
+                yield f"policy-{n}", json.loads(line)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="把多份解析结果批量生成中文保单（zip 或合并成一个 .docx）")
+    ap.add_argument("source", help="utils.batch 的输出目录，或每行一个解析结果的 .jsonl")
+    ap.add_argument("-o", "--out", required=True, help="输出文件（.zip，或配合 --merged 的 .docx）")
+    ap.add_argument("-t", "--template", default=DEFAULT_TEMPLATE, help="Word 模板路径")
+    ap.add_argument("--merged", action="store_true", help="合并成一个 .docx，每份保单之间分页")
+    args = ap.parse_args(argv)
+
+    results = load_results(args.source)
+    with open(args.out, "wb") as f:
+        if args.merged:
+            count = render_merged((data for _, data in results), f, args.template)
+        else:
+            count = render_zip(results, f, args.template)
+    print(f"完成 {count} 份 -> {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
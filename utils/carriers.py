@@ -0,0 +1,137 @@
+"""
+Carrier profiles: the parsing rules used for one insurer's quotes.
+
+A profile carries the coverage label sets, the line windows the linear
+coverages assembler searches around a label, the markers that end the
+Coverages block, the premium labels (tried in order) and the OCR mode. All
+patterns are compiled once, when the profile is built.
+
+detect_profile() lowercases the text once and picks the first registered
+profile whose name occurs in it, so when several carriers are named the one
+registered first wins. Text naming no carrier gets GENERIC. (One alternation
+regex over all names was measured several times slower than CPython's
+substring search here.) parse_quote_text detects once per quote and passes the
+profile down.
+
+The registered carriers are scaffolding for now: each one only names itself
+and keeps every generic rule, because the repo holds no carrier samples to
+tune against (the benchmark corpus prints the same layout for every carrier).
+A carrier is tuned by registering a profile with only the differing fields
+overridden:
+
+    register(PROFILES["Geico"].replace(window=4, ocr_mode="detect"))
+"""
+import re
+from typing import Dict, Pattern, Sequence, Tuple, Union
+
+DEFAULT_COMPANY = "某保险公司"
+
+# canonical coverage label -> lowercase aliases; the first label with an alias in the line wins
+GENERIC_LABELS: Dict[str, Tuple[str, ...]] = {
+    "liability": ("liability", "bodily injury liability", "liability to others"),
+    "property_damage": ("property damage", "property damage liability"),
+    "umbi": ("uninsured/underinsured motorists", "uninsured motorist bodily injury", "underinsured motorist bodily injury", "umbi", "uninsd/underinsd motorists"),
+    "umpd": ("uninsured/underinsured motorists pd", "uninsured motorist property damage", "underinsured motorist property damage", "umpd", "uninsd/underinsd motorists pd"),
+    "comprehensive": ("comprehensive",),
+    "collision": ("collision",),
+    "rental": ("rental",),
+    "roadside": ("roadside assistance", "roadside assistance coverage", "roadside"),
+}
+
+GENERIC_COVERAGES_END = (
+    r"TOTAL\s+PER\s+VEHICLE|Discounts|Taxes\s+and\s+Fees|"
+    r"Driver\s+Quote\s+Details|Vehicle\s+Quote\s+Details"
+)
+
+# the premium is the first $x.xx after a label's first occurrence; most specific label first
+GENERIC_PREMIUM_LABELS = (
+    r"estimated\s+pay-?in-?full",
+    r"pay-?in-?full",
+    r"Total\s+\d+\s+month\s+policy\s+premium",
+    r"your\s+estimated\s+total\s+premium",
+    r"Total\s+policy\s+premium",
+)
+
+
+def _compile(p: Union[str, Pattern]) -> Pattern:
+    return re.compile(p, re.I) if isinstance(p, str) else p
+
+
+class CarrierProfile:
+    __slots__ = ("name", "aliases", "labels", "label_re", "coverages_end", "premium_labels",
+                 "window", "rental_window", "ocr_mode")
+
+    def __init__(self, name: str, aliases: Sequence[str] = (),
+                 labels: Dict[str, Tuple[str, ...]] = GENERIC_LABELS,
+                 coverages_end: Union[str, Pattern] = GENERIC_COVERAGES_END,
+                 premium_labels: Sequence[Union[str, Pattern]] = GENERIC_PREMIUM_LABELS,
+                 window: int = 3, rental_window: Tuple[int, int] = (4, 2), ocr_mode: str = ""):
+        self.name = name
+        self.aliases = tuple(a.lower() for a in aliases)
+        self.labels = labels
+        # one search rejects lines carrying no label before the per-label priority check
+        self.label_re = re.compile("|".join(re.escape(a) for arr in labels.values() for a in arr))
+        self.coverages_end = _compile(coverages_end)
+        self.premium_labels = tuple(_compile(p) for p in premium_labels)
+        self.window = window                # lines above / below a coverage label searched for its value
+        self.rental_window = rental_window  # (above, below); the rental limit often sits a few lines up
+        self.ocr_mode = ocr_mode            # "" = the pipeline default
+
+    def replace(self, **changes) -> "CarrierProfile":
+        fields = {k: getattr(self, k) for k in self.__slots__ if k != "label_re"}
+        fields.update(changes)
+        return CarrierProfile(**fields)
+
+    def canon(self, lowered: str) -> str:
+        """Canonical coverage label of a lowercased line, or ""."""
+        if not self.label_re.search(lowered):
+            return ""
+        for k, arr in self.labels.items():
+            if any(a in lowered for a in arr):
+                return k
+        return ""
+
+    def canon_longest(self, lowered: str) -> str:
+        """Like canon, but the label with the longest alias in the line wins.
+
+        "uninsured motorist property damage" is then umpd rather than property_damage.
+        """
+        if not self.label_re.search(lowered):
+            return ""
+        best, size = "", 0
+        for k, arr in self.labels.items():
+            for a in arr:
+                if len(a) > size and a in lowered:
+                    best, size = k, len(a)
+        return best
+
+    def __repr__(self) -> str:
+        return f"CarrierProfile({self.name!r})"
+
+
+GENERIC = CarrierProfile(DEFAULT_COMPANY)
+
+# registration order is detection priority
+PROFILES: Dict[str, CarrierProfile] = {}
+_aliases: Tuple[Tuple[str, CarrierProfile], ...] = ()
+
+
+def register(profile: CarrierProfile) -> None:
+    """Add a profile, or replace the one with the same name keeping its priority."""
+    global _aliases
+    PROFILES[profile.name] = profile
+    _aliases = tuple((a, p) for p in PROFILES.values() for a in p.aliases)
+
+
+# names only, on the generic rules; see the module docstring
+for _name in ("Progressive", "Travelers", "Allstate", "Geico",
+              "Liberty Mutual", "Safeco", "State Farm", "Nationwide"):
+    register(CarrierProfile(_name, (_name,)))
+
+
+def detect_profile(text: str) -> CarrierProfile:
+    lowered = text.lower()
+    for alias, profile in _aliases:
+        if alias in lowered:
+            return profile
+    return GENERIC
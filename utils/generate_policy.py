@@ -1,99 +1,180 @@
+import io
+import re
+import tempfile
+from contextlib import contextmanager
 from docx import Document
 from docx.shared import Pt, RGBColor
 from docx.enum.text import WD_ALIGN_PARAGRAPH
-from copy import deepcopy
+from docx.oxml import OxmlElement
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 
+from utils import metrics
+from utils.quote_model import Quote, Vehicle, dollars, money
+from copy import deepcopy
 
-def generate_policy_docx(doc: Document, data: dict):
+PLACEHOLDER_RE = re.compile(r"\{\{[A-Z_]+\}\}")
+
+
+def generate_policy_docx(doc: Document, data: Quote):
+    # 金额都是整数（分），只在这里格式化一次；旧的 dict 格式先转换成 Quote
+    if isinstance(data, dict):
+        data = Quote.from_dict(data)
+    index = TemplateIndex(doc)
+    index.fill(policy_placeholder_values(data))
+    index.write_checkboxes({
+        "Liability": data.liability.selected,
+        "Uninsured Motorist": data.uninsured_motorist.selected,
+        "Medical Payment": data.medical_payment.selected,
+        "Personal Injury": data.personal_injury.selected,
+    })
+
+    insert_vehicle_section(doc, data.vehicles)
+
+
+# 超过这个大小的生成文档才写到临时文件
+SPILL_OVER_BYTES = 8 * 1024 * 1024
+
+
+def render_policy_docx(doc: Document, data: Quote, out=None):
+    """
+    生成保单并直接写进 out（任意可写流）；不传 out 时写进内存并返回 BytesIO（已回到开头）。
+    """
+    with metrics.stage("generate_policy_docx"):
+        generate_policy_docx(doc, data)
+    if out is None:
+        out = io.BytesIO()
+    with metrics.stage("docx_save"):
+        doc.save(out)
+    if out.seekable():
+        out.seek(0)
+    return out
+
+
+@contextmanager
+def rendered_policy_file(doc: Document, data: Quote, spill_over: int = SPILL_OVER_BYTES):
+    """
+    小文档留在内存，超过 spill_over 字节才落到临时文件；离开 with 时无论成功失败都会清理。
+    """
+    with tempfile.SpooledTemporaryFile(max_size=spill_over, suffix=".docx") as f:
+        render_policy_docx(doc, data, f)
+        yield f
+
+
+def policy_placeholder_values(data: Quote) -> dict:
+    # 占位符 -> 替换文本；未出现的占位符保持原样
+    values = {}
     # 替换公司名称和价格信息
-    replace_placeholder_text(doc, "{{COMPANY}}", data.get("company", "某保险公司"))
-    price_info = f"{data.get('total_premium', '$XXX')}/{data.get('policy_term', '6个月')}，一次性付款"
-    replace_placeholder_text(doc, "{{PRICE_INFO}}", price_info)
+    values["{{COMPANY}}"] = data.company
+    values["{{PRICE_INFO}}"] = f"{money(data.total_premium, always_cents=True)}/{data.policy_term}，一次性付款"
 
     # 责任险
-    write_checkbox_and_amount(doc, "Liability", data["liability"]["selected"])
-    if data["liability"]["selected"]:
-        replace_placeholder_text(doc, "{{LIAB_BI_PP}}", data['liability']['bi_per_person'])
-        replace_placeholder_text(doc, "{{LIAB_BI_PA}}", data['liability']['bi_per_accident'])
-        replace_placeholder_text(doc, "{{LIAB_PD}}", data['liability']['pd'])
+    liability = data.liability
+    if liability.selected:
+        values["{{LIAB_BI_PP}}"] = money(liability.bi_per_person)
+        values["{{LIAB_BI_PA}}"] = money(liability.bi_per_accident)
+        values["{{LIAB_PD}}"] = money(liability.pd)
     else:
-        clear_liability_section(doc)
+        values.update(LIABILITY_CLEARED)
 
     # 无保险驾驶者
-    write_checkbox_and_amount(doc, "Uninsured Motorist", data["uninsured_motorist"]["selected"])
-    if data["uninsured_motorist"]["selected"]:
-        if data["uninsured_motorist"].get("bi_per_person"):
-            replace_placeholder_text(doc, "{{UNINS_BI_PP}}", data['uninsured_motorist']['bi_per_person'])
-        if data["uninsured_motorist"].get("bi_per_accident"):
-            replace_placeholder_text(doc, "{{UNINS_BI_PA}}", data['uninsured_motorist']['bi_per_accident'])
-        if data["uninsured_motorist"].get("pd"):
-            replace_placeholder_text(doc, "{{UNINS_PD}}", data['uninsured_motorist']['pd'])
+    um = data.uninsured_motorist
+    if um.selected:
+        if um.bi_per_person is not None:
+            values["{{UNINS_BI_PP}}"] = money(um.bi_per_person)
+        if um.bi_per_accident is not None:
+            values["{{UNINS_BI_PA}}"] = money(um.bi_per_accident)
+        if um.pd is not None:
+            values["{{UNINS_PD}}"] = money(um.pd)
     else:
-        clear_uninsured_section(doc)
+        values.update(UNINSURED_CLEARED)
 
-    # Medical Payment
-    write_checkbox_and_amount(doc, "Medical Payment", data["medical_payment"]["selected"])
-    if data["medical_payment"]["selected"]:
-        replace_placeholder_text(doc, "{{MED}}", data['medical_payment']['med'])
-    else:
-        replace_placeholder_text(doc, "{{MED}}", "没有选择该项目")
+    # Medical Payment / Personal Injury
+    values["{{MED}}"] = money(data.medical_payment.amount) if data.medical_payment.selected else "没有选择该项目"
+    values["{{PIP}}"] = money(data.personal_injury.amount) if data.personal_injury.selected else "没有选择该项目"
+    return values
 
-    # Personal Injury
-    write_checkbox_and_amount(doc, "Personal Injury", data["personal_injury"]["selected"])
-    if data["personal_injury"]["selected"]:
-        replace_placeholder_text(doc, "{{PIP}}", data['personal_injury']['pip'])
-    else:
-        replace_placeholder_text(doc, "{{PIP}}", "没有选择该项目")
 
-    insert_vehicle_section(doc, data.get("vehicles", []))
+LIABILITY_CLEARED = {"{{LIAB_BI_PP}}": "没有选择该项目", "{{LIAB_BI_PA}}": "", "{{LIAB_PD}}": ""}
+UNINSURED_CLEARED = {"{{UNINS_BI_PP}}": "没有选择该项目", "{{UNINS_BI_PA}}": "", "{{UNINS_PD}}": ""}
 
 
 def clear_liability_section(doc):
-    replace_placeholder_text(doc, "{{LIAB_BI_PP}}", "没有选择该项目")
-    replace_placeholder_text(doc, "{{LIAB_BI_PA}}", "")
-    replace_placeholder_text(doc, "{{LIAB_PD}}", "")
+    TemplateIndex(doc).fill(LIABILITY_CLEARED)
 
 
 def clear_uninsured_section(doc):
-    replace_placeholder_text(doc, "{{UNINS_BI_PP}}", "没有选择该项目")
-    replace_placeholder_text(doc, "{{UNINS_BI_PA}}", "")
-    replace_placeholder_text(doc, "{{UNINS_PD}}", "")
+    TemplateIndex(doc).fill(UNINSURED_CLEARED)
 
 
-def replace_placeholder_text(doc, placeholder, replacement):
-    # 替换段落中的占位符
+def _iter_paragraphs(doc):
+    # 正文段落 + 表格单元格段落（合并单元格只出现一次）
+    seen = set()
     for paragraph in doc.paragraphs:
-        full_text = "".join(run.text for run in paragraph.runs)
-        if placeholder in full_text:
-            new_text = full_text.replace(placeholder, replacement)
-            for run in paragraph.runs:
-                run.text = ""
-            if paragraph.runs:
-                paragraph.runs[0].text = new_text
-            else:
-                paragraph.add_run(new_text)
-
-    # 替换表格中的占位符
+        yield paragraph
     for table in doc.tables:
         for row in table.rows:
             for cell in row.cells:
                 for paragraph in cell.paragraphs:
-                    full_text = "".join(run.text for run in paragraph.runs)
-                    if placeholder in full_text:
-                        new_text = full_text.replace(placeholder, replacement)
-                        for run in paragraph.runs:
-                            run.text = ""
-                        if paragraph.runs:
-                            paragraph.runs[0].text = new_text
-                        else:
-                            paragraph.add_run(new_text)
+                    if paragraph._p in seen:
+                        continue
+                    seen.add(paragraph._p)
+                    yield paragraph
 
 
-def write_checkbox_and_amount(doc, keyword, selected):
-    symbol = "✅" if selected else "❌"
-    for table in doc.tables:
-        for row in table.rows:
-            if keyword in row.cells[0].text:
+def _set_paragraph_text(paragraph, new_text):
+    for run in paragraph.runs:
+        run.text = ""
+    if paragraph.runs:
+        paragraph.runs[0].text = new_text
+    else:
+        paragraph.add_run(new_text)
+
+
+class TemplateIndex:
+    """
+    模板只扫描一次：记录每个占位符所在的段落，以及每个表格行的首列文字，
+    之后所有替换和勾选都只访问命中的段落/行。
+    """
+
+    def __init__(self, doc):
+        self.placeholders = {}  # 占位符 -> [段落]
+        self.rows = []          # [(首列文字, 行)]
+        for paragraph in _iter_paragraphs(doc):
+            text = paragraph.text
+            if "{{" not in text:
+                continue
+            for name in dict.fromkeys(PLACEHOLDER_RE.findall(text)):
+                self.placeholders.setdefault(name, []).append(paragraph)
+        for table in doc.tables:
+            for row in table.rows:
+                cells = row.cells
+                if cells:
+                    self.rows.append((cells[0].text, row))
+
+    def fill(self, values: dict):
+        # 每个段落只重写一次，按 values 的顺序依次替换
+        targets = {}
+        for placeholder in values:
+            for paragraph in self.placeholders.get(placeholder, ()):
+                targets.setdefault(paragraph._p, paragraph)
+        for paragraph in targets.values():
+            new_text = "".join(run.text for run in paragraph.runs)
+            hit = False
+            for placeholder, replacement in values.items():
+                if placeholder in new_text:
+                    new_text = new_text.replace(placeholder, replacement)
+                    hit = True
+            if hit:
+                _set_paragraph_text(paragraph, new_text)
+
+    def write_checkboxes(self, selected_by_keyword: dict):
+        for first_text, row in self.rows:
+            symbol = None
+            for keyword, selected in selected_by_keyword.items():
+                if keyword in first_text:
+                    symbol = "✅" if selected else "❌"
+            if symbol is not None:
                 cell = row.cells[1]
                 cell.text = symbol
                 cell.paragraphs[0].alignment = WD_ALIGN_PARAGRAPH.CENTER
@@ -101,90 +182,105 @@ def write_checkbox_and_amount(doc, keyword, selected):
                 run.font.size = Pt(16)
 
 
+def replace_placeholder_text(doc, placeholder, replacement):
+    TemplateIndex(doc).fill({placeholder: replacement})
+
+
+def write_checkbox_and_amount(doc, keyword, selected):
+    TemplateIndex(doc).write_checkboxes({keyword: selected})
+
+
+def _is_vehicle_table(tbl) -> bool:
+    rows = tbl._tbl.tr_lst
+    if len(rows) < 5:
+        return False
+    return "Collision" in tbl.cell(1, 0).text and "租车" in tbl.cell(4, 0).text
+
+
+def _paragraph_after(anchor_el, parent, text):
+    p_el = OxmlElement("w:p")
+    anchor_el.addnext(p_el)
+    paragraph = Paragraph(p_el, parent)
+    paragraph.add_run(text)
+    return paragraph
+
+
 def insert_vehicle_section(doc: Document, vehicles: list):
     if not vehicles:
         return
 
     # 找到“车辆保障:”段落
-    marker_idx = -1
-    for i, p in enumerate(doc.paragraphs):
+    marker_p = None
+    for p in doc.paragraphs:
         if "车辆保障:" in p.text:
-            marker_idx = i
+            marker_p = p
             break
-    if marker_idx == -1:
+    if marker_p is None:
         return
-
-    marker_p = doc.paragraphs[marker_idx]
     marker_el = marker_p._element
 
+    # 查找模板中第一个完整车辆保障表格作为复制模板（必须在清除旧内容之前）
+    vehicle_table_template = None
+    for tbl in doc.tables:
+        if _is_vehicle_table(tbl):
+            vehicle_table_template = tbl._element
+            break
+    if vehicle_table_template is None:
+        return
+
     # 清除后续旧表格和 VIN 信息
+    body = marker_el.getparent()
     next_el = marker_el.getnext()
     while next_el is not None and (next_el.tag.endswith("p") or next_el.tag.endswith("tbl")):
         to_remove = next_el
         next_el = next_el.getnext()
-        marker_el.getparent().remove(to_remove)
-
-    # 查找模板中第一个完整车辆保障表格作为复制模板
-    vehicle_table_template = None
-    for tbl in doc.tables:
-        if "Collision" in tbl.cell(1, 0).text and "租车报销" in tbl.cell(4, 0).text:
-            vehicle_table_template = tbl
-            break
-    if not vehicle_table_template:
-        return
+        body.remove(to_remove)
 
+    # 按顺序逐个追加，游标始终是上一辆车的表格，整体线性
+    parent = marker_p._parent
+    cursor = marker_el
     for vehicle in vehicles:
         # 插入视觉空行
-        spacer_p = marker_p.insert_paragraph_after("·")
+        spacer_p = _paragraph_after(cursor, parent, "·")
         spacer_p.runs[0].font.size = Pt(1)
         spacer_p.runs[0].font.color.rgb = RGBColor(255, 255, 255)
 
         # 插入 VIN 信息
-        vin_text = f"{vehicle['model']}     VIN：{vehicle['vin']}"
-        vin_p = spacer_p.insert_paragraph_after(vin_text)
+        vin_text = f"{vehicle.model}     VIN：{vehicle.vin}"
+        vin_p = _paragraph_after(spacer_p._element, parent, vin_text)
         vin_p.runs[0].font.size = Pt(12)
         vin_p.runs[0].bold = True
 
         # 插入复制表格
-        new_table = deepcopy(vehicle_table_template._element)
+        new_table = deepcopy(vehicle_table_template)
         vin_p._element.addnext(new_table)
-        new_table_obj = vin_p._element.getnext()
+        fill_vehicle_table(Table(new_table, parent), vehicle)
 
-        fill_vehicle_table(doc, new_table_obj, vehicle)
+        cursor = new_table
 
-        marker_p = doc.paragraphs[-1]
-
-
-def fill_vehicle_table(doc: Document, table_el, vehicle: dict):
-    tbl = None
-    for t in doc.tables:
-        if t._element == table_el:
-            tbl = t
-            break
-    if not tbl:
-        return
 
-    update_checkbox_cell(tbl.cell(1, 1), vehicle["collision"]["selected"])
-    update_checkbox_cell(tbl.cell(2, 1), vehicle["comprehensive"]["selected"])
-    update_checkbox_cell(tbl.cell(3, 1), vehicle["roadside"]["selected"])
-    update_checkbox_cell(tbl.cell(4, 1), vehicle["rental"]["selected"])
+def fill_vehicle_table(tbl: Table, vehicle: Vehicle):
+    update_checkbox_cell(tbl.cell(1, 1), vehicle.collision.selected)
+    update_checkbox_cell(tbl.cell(2, 1), vehicle.comprehensive.selected)
+    update_checkbox_cell(tbl.cell(3, 1), vehicle.roadside)
+    update_checkbox_cell(tbl.cell(4, 1), vehicle.rental.selected)
 
-    if vehicle["collision"]["selected"]:
-        tbl.cell(1, 2).text = f"自付额${vehicle['collision']['deductible']}\n修车时自付额以内自己出，自付额以外的保险公司赔付"
+    if vehicle.collision.selected:
+        tbl.cell(1, 2).text = f"自付额${dollars(vehicle.collision.deductible)}\n修车时自付额以内自己出，自付额以外的保险公司赔付"
     else:
         tbl.cell(1, 2).text = "没有选择该项目"
 
-    if vehicle["comprehensive"]["selected"]:
-        tbl.cell(2, 2).text = f"自付额${vehicle['comprehensive']['deductible']}\n修车时自付额以内自己出，自付额以外的保险公司赔付"
+    if vehicle.comprehensive.selected:
+        tbl.cell(2, 2).text = f"自付额${dollars(vehicle.comprehensive.deductible)}\n修车时自付额以内自己出，自付额以外的保险公司赔付"
     else:
         tbl.cell(2, 2).text = "没有选择该项目"
 
-    if vehicle["roadside"]["selected"]:
+    if vehicle.roadside:
         tbl.cell(3, 2).text = "赔偿由于:机械故障,电瓶没电,钥匙被锁车内,燃油耗尽,轮胎没气造成车辆不可行驶时的免费拖车，免费充电，免费开锁服务"
     else:
         tbl.cell(3, 2).text = "没有选择该项目"
 
-    if vehicle["rental"]["selected"]:
+    if vehicle.rental.selected:
         tbl.cell(4, 2).text = "每天$30 最多30天"
     else:
         tbl.cell(4, 2).text = "没有选择该项目"
@@ -0,0 +1,100 @@
+"""
+进程内后台任务：同一个键（例如上传文件的哈希）只执行一次，结果留在内存里，页面只轮询进度。
+
+    store = JobStore(workers=2)
+    job = store.submit(key, fn)   # 在线程池里执行 fn(progress)；progress(stage) 报告当前阶段
+    job.stage / job.done / job.result / job.error
+
+最多保留 max_jobs 个任务，超出时丢掉最久没被访问的已完成任务。失败的任务不会自动重跑，
+要调用 retry()。
+"""
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from utils import metrics
+
+
+class Job:
+    __slots__ = ("key", "stage", "result", "error", "trace", "started", "finished")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.stage = ""        # 最近一次 progress() 报告的阶段；"" = 还在排队
+        self.result: Any = None
+        self.error = ""
+        self.trace = ""
+        self.started = time.time()
+        self.finished: Optional[float] = None
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    @property
+    def ok(self) -> bool:
+        return self.done and not self.error
+
+
+class JobStore:
+    def __init__(self, workers: int = 2, max_jobs: int = 64):
+        self.max_jobs = max_jobs
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()  # 最久没访问的在前
+
+    def get(self, key: str) -> Optional[Job]:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self._jobs.move_to_end(key)
+            return job
+
+    def submit(self, key: str, fn: Callable[[Callable[[str], None]], Any]) -> Job:
+        """返回 key 对应的任务；还没有时才提交 fn。"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None:
+                self._jobs.move_to_end(key)
+                return job
+            job = self._jobs[key] = Job(key)
+            self._evict()
+        metrics.incr("jobs_submitted")
+        self._pool.submit(self._run, job, fn)
+        return job
+
+    def retry(self, key: str, fn: Callable[[Callable[[str], None]], Any]) -> Job:
+        """丢掉失败的任务重新提交；成功或还在执行的任务原样返回。"""
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.done and job.error:
+                del self._jobs[key]
+        return self.submit(key, fn)
+
+    def _run(self, job: Job, fn) -> None:
+        def progress(stage: str) -> None:
+            job.stage = stage
+
+        try:
+            with metrics.stage("job"):
+                job.result = fn(progress)
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.trace = traceback.format_exc()
+            metrics.incr("jobs_failed")
+        finally:
+            job.finished = time.time()
+
+    def _evict(self) -> None:
+        # 正在执行的任务不丢，页面还在等它
+        while len(self._jobs) > self.max_jobs:
+            old = next((k for k, j in self._jobs.items() if j.done), None)
+            if old is None:
+                return
+            del self._jobs[old]
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,74 @@
+"""
+Page geometry for layout-aware extraction.
+
+A LayoutLine is one OCR or text-layer line with its bounding box in page
+fractions. RowIndex buckets lines into horizontal bands one median line height
+tall, keyed by page and the band of their vertical centre. The cells sharing a
+row with a label are then read from three buckets, instead of scanning a window
+of lines around it in reading order.
+"""
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+
+from utils.textract_graph import Box
+
+
+class LayoutLine(NamedTuple):
+    page: int
+    text: str
+    left: float
+    top: float
+    right: float
+    bottom: float
+
+    @property
+    def middle(self) -> float:
+        return (self.top + self.bottom) / 2
+
+
+def ocr_layout(page: int, lines: Sequence[str], boxes: Sequence[Box]) -> List[LayoutLine]:
+    """Layout of one OCR'd page from its Textract LINE texts and boxes."""
+    return [LayoutLine(page, t, *b) for t, b in zip(lines, boxes) if t.strip()]
+
+
+def pdf_layout(page, number: int) -> List[LayoutLine]:
+    """Layout of one PyMuPDF page's text layer."""
+    w, h = page.rect.width or 1, page.rect.height or 1
+    out = []
+    for block in page.get_text("dict", sort=True)["blocks"]:
+        for line in block.get("lines", ()):
+            text = "".join(span["text"] for span in line["spans"]).strip()
+            if text:
+                x0, y0, x1, y1 = line["bbox"]
+                out.append(LayoutLine(number, text, x0 / w, y0 / h, x1 / w, y1 / h))
+    return out
+
+
+class RowIndex:
+    __slots__ = ("lines", "band", "_buckets")
+
+    def __init__(self, lines: Sequence[LayoutLine]):
+        self.lines = list(lines)
+        heights = sorted(ln.bottom - ln.top for ln in self.lines if ln.bottom > ln.top)
+        self.band = heights[len(heights) // 2] if heights else 0.01
+        self._buckets: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for i, ln in enumerate(self.lines):
+            self._buckets[(ln.page, int(ln.middle / self.band))].append(i)
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    def row(self, i: int) -> List[int]:
+        """Lines on line ``i``'s row that start right of it, nearest first."""
+        ln = self.lines[i]
+        b = int(ln.middle / self.band)
+        reach = self.band / 2
+        out = []
+        for k in (b - 1, b, b + 1):
+            for j in self._buckets.get((ln.page, k), ()):
+                o = self.lines[j]
+                # a band of horizontal slack for cells that touch or slightly overlap the label
+                if j != i and abs(o.middle - ln.middle) <= reach and o.left >= ln.right - self.band:
+                    out.append(j)
+        out.sort(key=lambda j: self.lines[j].left)
+        return out
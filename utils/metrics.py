@@ -0,0 +1,181 @@
+"""
+Per-stage timing and counters for the quote pipeline.
+
+    from utils import metrics
+    with metrics.stage("extract_vehicles"):
+        ...
+    metrics.incr("ocr_bytes_sent", len(png))
+
+Disabled by default. While disabled, stage() returns a shared no-op context
+manager and incr() returns at once. Enable with metrics.enable() or the
+environment: QUOTE_METRICS=1 aggregates, QUOTE_METRICS=log also writes every
+stage as a JSON line to the "chinesequote.metrics" logger. Aggregates are
+exported by snapshot() (plain dict) and prometheus_text().
+"""
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger("chinesequote.metrics")
+
+PREFIX = "quote"
+
+_enabled = False
+_lock = threading.Lock()
+_stages: Dict[str, List[float]] = {}  # stage -> [count, total seconds, max seconds]
+_counters: Dict[str, float] = {}
+_sinks: List[Callable[[Dict[str, Any]], None]] = []
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopStage()
+
+
+class _Stage:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        observe(self.name, time.perf_counter() - self.start, ok=exc_type is None)
+        return False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def stage(name: str):
+    """Context manager timing one pipeline stage (no-op while disabled)."""
+    if not _enabled:
+        return _NOOP
+    return _Stage(name)
+
+
+def observe(name: str, seconds: float, ok: bool = True) -> None:
+    if not _enabled:
+        return
+    with _lock:
+        agg = _stages.get(name)
+        if agg is None:
+            agg = _stages[name] = [0, 0.0, 0.0]
+        agg[0] += 1
+        agg[1] += seconds
+        if seconds > agg[2]:
+            agg[2] = seconds
+    if _sinks:
+        _emit({"event": "stage", "stage": name, "seconds": round(seconds, 6), "ok": ok})
+
+
+def incr(name: str, value: float = 1) -> None:
+    """Add ``value`` to counter ``name`` (no-op while disabled)."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def _emit(event: Dict[str, Any]) -> None:
+    for sink in list(_sinks):
+        try:
+            sink(event)
+        except Exception:
+            logger.exception("metrics sink failed")
+
+
+def log_sink(event: Dict[str, Any]) -> None:
+    logger.info(json.dumps(event, ensure_ascii=False))
+
+
+def add_sink(sink: Callable[[Dict[str, Any]], None]) -> None:
+    if sink not in _sinks:
+        _sinks.append(sink)
+
+
+def remove_sink(sink: Callable[[Dict[str, Any]], None]) -> None:
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+def enable(log: bool = False) -> None:
+    global _enabled
+    _enabled = True
+    if log:
+        add_sink(log_sink)
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+    _sinks.clear()
+
+
+def reset() -> None:
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def snapshot() -> Dict[str, Any]:
+    with _lock:
+        return {
+            "stages": {k: {"count": v[0], "seconds": v[1], "max_seconds": v[2]} for k, v in _stages.items()},
+            "counters": dict(_counters),
+        }
+
+
+def merge(snap: Dict[str, Any]) -> None:
+    """Fold a snapshot from another process (e.g. a batch worker) into this registry."""
+    with _lock:
+        for name, s in snap.get("stages", {}).items():
+            agg = _stages.setdefault(name, [0, 0.0, 0.0])
+            agg[0] += s["count"]
+            agg[1] += s["seconds"]
+            agg[2] = max(agg[2], s["max_seconds"])
+        for name, v in snap.get("counters", {}).items():
+            _counters[name] = _counters.get(name, 0) + v
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def prometheus_text() -> str:
+    snap = snapshot()
+    out = [
+        f"# HELP {PREFIX}_stage_seconds Wall time spent per pipeline stage.",
+        f"# TYPE {PREFIX}_stage_seconds summary",
+    ]
+    for name, s in sorted(snap["stages"].items()):
+        out.append(f'{PREFIX}_stage_seconds_sum{{stage="{_label(name)}"}} {s["seconds"]:.6f}')
+        out.append(f'{PREFIX}_stage_seconds_count{{stage="{_label(name)}"}} {s["count"]}')
+    out.append(f"# TYPE {PREFIX}_stage_seconds_max gauge")
+    for name, s in sorted(snap["stages"].items()):
+        out.append(f'{PREFIX}_stage_seconds_max{{stage="{_label(name)}"}} {s["max_seconds"]:.6f}')
+    for name, v in sorted(snap["counters"].items()):
+        metric = f"{PREFIX}_{name}_total"
+        out.append(f"# TYPE {metric} counter")
+        out.append(f"{metric} {v:g}")
+    return "\n".join(out) + "\n"
+
+
+_env = os.environ.get("QUOTE_METRICS", "").lower()
+if _env in ("1", "true", "on", "log"):
+    enable(log=_env == "log")
@@ -0,0 +1,142 @@
+"""
+Content-addressed cache of raw Textract responses.
+
+Entries are keyed on the SHA-256 of the page PNG plus the Textract call kind and
+hold the response Blocks as gzipped JSON, so pages uploaded again skip OCR and
+stored pages can be re-parsed after parser changes. The directory is bounded by
+size; least recently used entries are evicted first.
+
+The stored Blocks are the customer's full quote (names, addresses, VINs), so
+the cache is off unless OCR_CACHE_DIR names a directory (empty or "off" also
+disables it). The size bound is OCR_CACHE_MAX_MB.
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+DEFAULT_MAX_MB = 512
+
+
+def page_hash(img_png_bytes: bytes) -> str:
+    return hashlib.sha256(img_png_bytes).hexdigest()
+
+
+class OcrCache:
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # path -> size, oldest first
+        self._size = 0
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self) -> None:
+        found = []
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".json.gz"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._size += size
+
+    def _path(self, kind: str, digest: str) -> str:
+        return os.path.join(self.root, kind, digest[:2], digest + ".json.gz")
+
+    def get(self, kind: str, digest: str) -> Optional[Dict[str, Any]]:
+        path = self._path(kind, digest)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                resp = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        try:
+            os.utime(path)  # mtime doubles as LRU order across restarts
+        except OSError:
+            pass
+        return resp
+
+    def put(self, kind: str, digest: str, resp: Dict[str, Any]) -> None:
+        path = self._path(kind, digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        payload = {k: v for k, v in resp.items() if k != "ResponseMetadata"}
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+        with self._lock:
+            self._size += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def iter_responses(self, kind: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (page hash, stored response) for every cached entry of ``kind``."""
+        base = os.path.join(self.root, kind)
+        for dirpath, _, names in os.walk(base):
+            for name in sorted(names):
+                if not name.endswith(".json.gz"):
+                    continue
+                try:
+                    with gzip.open(os.path.join(dirpath, name), "rt", encoding="utf-8") as f:
+                        yield name[:-len(".json.gz")], json.load(f)
+                except (OSError, ValueError):
+                    continue
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+
+_cache: Optional[OcrCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> Optional[OcrCache]:
+    """Process-wide cache from the environment; None when disabled or unusable."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                root = os.environ.get("OCR_CACHE_DIR", "")
+                if not root or root.lower() == "off":
+                    return None
+                max_mb = int(os.environ.get("OCR_CACHE_MAX_MB", DEFAULT_MAX_MB))
+                try:
+                    _cache = OcrCache(root, max_mb * 1024 * 1024)
+                except OSError:
+                    return None
+    return _cache
@@ -0,0 +1,327 @@
+"""
+Memoized parse results: OCR text -> the parsed quote dict.
+
+Parsing is a pure function of the quote text, its page layout and the parser
+code, so results are keyed on the SHA-256 of the normalized text plus layout
+and stored per PARSER_VERSION (bump it in utils.parse_quote whenever an
+extractor changes its output). Re-rendering a quote, e.g. after a template
+change, then skips every extractor.
+
+Two tiers: an in-process LRU of serialized results, and a directory holding
+the text archive (text and layout by fingerprint, version-independent) next to
+one result tree per parser version:
+
+    <root>/text/ab/<digest>.json.gz
+    <root>/v3/ab/<digest>.json.gz
+
+After a version bump, ``python -m utils.parse_cache replay`` re-parses the
+archived texts in parallel and fills in the new version's results; texts that
+already have one are skipped, so replaying twice is a no-op. Result trees of
+other versions are removed afterwards.
+
+The archive holds full quote text (names, addresses, VINs), so the directory
+tier is off unless PARSE_CACHE_DIR names a directory. It is bounded by size:
+the least recently used fingerprints are evicted first, text and results
+together.
+
+Configured by PARSE_CACHE_DIR (unset, empty or "off" keeps only the memory
+tier), PARSE_CACHE_MAX_MB and PARSE_CACHE_SIZE (memory entries, 0 disables
+the cache).
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_MAX_MB = 256
+
+Layout = Sequence[Sequence[Any]]  # LayoutLine tuples: page, text, left, top, right, bottom
+
+
+def normalize_text(text: str) -> str:
+    """Unified line breaks, no trailing whitespace: the text that is both hashed and parsed."""
+    return "\n".join(text.splitlines()).rstrip()
+
+
+def text_fingerprint(text: str, layout: Optional[Layout] = None) -> str:
+    """SHA-256 of already normalized text plus its layout."""
+    h = hashlib.sha256(text.encode("utf-8"))
+    if layout:
+        h.update(b"\0")
+        h.update(json.dumps([list(ln) for ln in layout], ensure_ascii=False).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _read_json(path: str) -> Optional[Any]:
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path: str, obj: Any) -> int:
+    """Write obj gzipped; returns the change in the file's size."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False)
+    size = os.path.getsize(tmp)
+    try:
+        size -= os.path.getsize(path)
+    except OSError:
+        pass
+    os.replace(tmp, path)
+    return size
+
+
+class ParseCache:
+    def __init__(self, version: int, root: Optional[str] = None, max_entries: int = DEFAULT_MEMORY_ENTRIES,
+                 max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024):
+        self.version = version
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, str]" = OrderedDict()  # digest -> result JSON, oldest first
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # digest -> bytes on disk (text + results), oldest first
+        self._size = 0
+        if root:
+            os.makedirs(root, exist_ok=True)
+            self._load()
+
+    def _load(self) -> None:
+        found: Dict[str, List[float]] = {}  # digest -> [newest mtime, bytes]
+        for dirpath, _, names in os.walk(self.root):
+            for name in names:
+                if not name.endswith(".json.gz"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                entry = found.setdefault(name[:-len(".json.gz")], [0.0, 0])
+                entry[0] = max(entry[0], st.st_mtime)
+                entry[1] += st.st_size
+        for digest, (_, size) in sorted(found.items(), key=lambda kv: kv[1][0]):
+            self._entries[digest] = size
+            self._size += size
+
+    def _version_dirs(self) -> List[str]:
+        try:
+            return [d for d in os.listdir(self.root) if d[:1] == "v" and d[1:].isdigit()]
+        except OSError:
+            return []
+
+    def _text_path(self, digest: str) -> str:
+        return os.path.join(self.root, "text", digest[:2], digest + ".json.gz")
+
+    def _result_path(self, digest: str) -> str:
+        return os.path.join(self.root, f"v{self.version}", digest[:2], digest + ".json.gz")
+
+    def _remember(self, digest: str, payload: str) -> None:
+        with self._lock:
+            self._memory[digest] = payload
+            self._memory.move_to_end(digest)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        """A fresh copy of the stored result, or None."""
+        with self._lock:
+            payload = self._memory.get(digest)
+            if payload is not None:
+                self._memory.move_to_end(digest)
+                self.hits += 1
+        if payload is not None:
+            return json.loads(payload)
+        data = _read_json(self._result_path(digest)) if self.root else None
+        if data is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            if digest in self._entries:
+                self._entries.move_to_end(digest)
+        try:
+            os.utime(self._result_path(digest))  # mtime doubles as LRU order across restarts
+        except OSError:
+            pass
+        self._remember(digest, json.dumps(data, ensure_ascii=False))
+        return data
+
+    def put(self, digest: str, data: Dict[str, Any], text: str = "", layout: Optional[Layout] = None) -> None:
+        """Store a result; with a root the text and layout go into the archive for replay."""
+        self._remember(digest, json.dumps(data, ensure_ascii=False))
+        if not self.root:
+            return
+        added = 0
+        try:
+            text_path = self._text_path(digest)
+            if text and not os.path.exists(text_path):
+                added += _write_json(text_path, {"text": text, "layout": [list(ln) for ln in layout or ()]})
+            added += _write_json(self._result_path(digest), data)
+        except (OSError, TypeError, ValueError):
+            pass
+        with self._lock:
+            self._entries[digest] = self._entries.get(digest, 0) + added
+            self._entries.move_to_end(digest)
+            self._size += added
+            self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            digest, size = self._entries.popitem(last=False)
+            self._size -= size
+            paths = [self._text_path(digest)]
+            paths += [os.path.join(self.root, d, digest[:2], digest + ".json.gz") for d in self._version_dirs()]
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def prune_versions(self) -> int:
+        """Remove the result trees of every other parser version; returns how many."""
+        if not self.root:
+            return 0
+        stale = [d for d in self._version_dirs() if d != f"v{self.version}"]
+        for d in stale:
+            shutil.rmtree(os.path.join(self.root, d), ignore_errors=True)
+        if stale:
+            # sizes per fingerprint changed under us; count them again
+            with self._lock:
+                self._entries.clear()
+                self._size = 0
+                self._load()
+        return len(stale)
+
+    def iter_texts(self) -> Iterator[Tuple[str, str, List[List[Any]]]]:
+        """Yield (fingerprint, text, layout) for every archived text."""
+        if not self.root:
+            return
+        for dirpath, _, names in os.walk(os.path.join(self.root, "text")):
+            for name in sorted(names):
+                if not name.endswith(".json.gz"):
+                    continue
+                entry = _read_json(os.path.join(dirpath, name))
+                if entry is not None:
+                    yield name[:-len(".json.gz")], entry["text"], entry.get("layout") or []
+
+    def has_result(self, digest: str) -> bool:
+        return bool(self.root) and os.path.exists(self._result_path(digest))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "entries": len(self._memory),
+                "disk_entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+
+_caches: Dict[int, ParseCache] = {}
+_cache_lock = threading.Lock()
+
+
+def get_parse_cache(version: int) -> Optional[ParseCache]:
+    """Process-wide cache for ``version`` from the environment; None when disabled."""
+    cache = _caches.get(version)
+    if cache is None:
+        with _cache_lock:
+            cache = _caches.get(version)
+            if cache is None:
+                size = int(os.environ.get("PARSE_CACHE_SIZE", DEFAULT_MEMORY_ENTRIES))
+                if size <= 0:
+                    return None
+                root = os.environ.get("PARSE_CACHE_DIR", "")
+                if not root or root.lower() == "off":
+                    root = None
+                max_mb = int(os.environ.get("PARSE_CACHE_MAX_MB", DEFAULT_MAX_MB))
+                try:
+                    cache = ParseCache(version, root, size, max_mb * 1024 * 1024)
+                except OSError:
+                    cache = ParseCache(version, None, size)
+                _caches[version] = cache
+    return cache
+
+
+def _replay_one(digest: str, text: str, layout: List[List[Any]]) -> Tuple[str, Dict[str, Any]]:
+    from utils.layout import LayoutLine
+    from utils.parse_quote import parse_quote_text
+
+    return digest, parse_quote_text(text, [LayoutLine(*ln) for ln in layout] or None).to_dict()
+
+
+def replay(root: str, workers: int = 0, force: bool = False,
+           max_bytes: int = DEFAULT_MAX_MB * 1024 * 1024) -> Tuple[int, int]:
+    """
+    Parse every archived text that has no result for the current PARSER_VERSION
+    (all of them with force), then drop the results of older versions.
+    Returns (parsed, skipped).
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from utils.parse_quote import PARSER_VERSION
+
+    cache = ParseCache(PARSER_VERSION, root, 0, max_bytes)
+    todo, skipped = [], 0
+    for digest, text, layout in cache.iter_texts():
+        if not force and cache.has_result(digest):
+            skipped += 1
+        else:
+            todo.append((digest, text, layout))
+    # workers only parse; results are written here so the size budget sees them
+    if workers == 1:
+        for digest, data in (_replay_one(*args) for args in todo):
+            cache.put(digest, data)
+    elif todo:
+        with ProcessPoolExecutor(max_workers=workers or None) as pool:
+            for digest, data in pool.map(_replay_one, *zip(*todo), chunksize=8):
+                cache.put(digest, data)
+    cache.prune_versions()
+    return len(todo), skipped
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Re-parse archived quote texts for the current parser version.")
+    ap.add_argument("command", choices=["replay", "stats"])
+    ap.add_argument("--dir", default=os.environ.get("PARSE_CACHE_DIR", ""), help="cache directory (default PARSE_CACHE_DIR)")
+    ap.add_argument("-w", "--workers", type=int, default=0, help="processes (0 = CPU count, 1 = no pool)")
+    ap.add_argument("--force", action="store_true", help="re-parse texts that already have a result")
+    args = ap.parse_args(argv)
+    if not args.dir or args.dir.lower() == "off":
+        ap.error("no cache directory: pass --dir or set PARSE_CACHE_DIR")
+
+    from utils.parse_quote import PARSER_VERSION
+
+    if args.command == "stats":
+        cache = ParseCache(PARSER_VERSION, args.dir, 0)
+        texts = done = 0
+        for digest, _, _ in cache.iter_texts():
+            texts += 1
+            done += cache.has_result(digest)
+        mb = cache.stats()["bytes"] / (1024 * 1024)
+        print(f"parser v{PARSER_VERSION}: {done}/{texts} archived texts parsed, {mb:.1f} MB on disk")
+        return 0
+    max_mb = int(os.environ.get("PARSE_CACHE_MAX_MB", DEFAULT_MAX_MB))
+    parsed, skipped = replay(args.dir, args.workers, args.force, max_mb * 1024 * 1024)
+    print(f"parser v{PARSER_VERSION}: parsed {parsed}, already current {skipped}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,24 @@
 
+import os
 import re
-import io
-import traceback
-from copy import deepcopy
-from typing import Dict, Any, List
-
-import fitz  # PyMuPDF
-from PIL import Image
-
-try:
-    import boto3
-    from botocore.exceptions import BotoCoreError, ClientError
-except Exception:
-    boto3 = None
-    BotoCoreError = Exception  # type: ignore
-    ClientError = Exception  # type: ignore
+import time
+import random
+import threading
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, List, NamedTuple, Optional, Pattern, Sequence, Tuple, Union
+
+# PyMuPDF, Pillow (via utils.raster) and boto3 are imported on first use: parsing text
+# never loads them, and a worker pays for boto3 only when it actually calls Textract
+from utils import metrics
+from utils.carriers import GENERIC, CarrierProfile, detect_profile
+from utils.layout import LayoutLine, RowIndex, ocr_layout, pdf_layout
+from utils.ocr_cache import get_ocr_cache, page_hash
+from utils.parse_cache import get_parse_cache, normalize_text, text_fingerprint
+from utils.quote_model import (DEFAULT_POLICY_TERM, Amount, Deductible, Liability, Quote, RentalLimit,
+                               UninsuredMotorist, Vehicle, money, to_cents)
+from utils.textract_graph import PageParse, parse_blocks
 
 YEAR_RE = r"(19\d{2}|20\d{2})"
 VIN_RE = r"([A-HJ-NPR-Z\d]{17})"
@@ -46,70 +50,127 @@ ADDR_STOP_WORDS = [
     "drive","dr","suite","ste","apt","unit"
 ]
 
+PAIR_RE = r"(\d{1,3}(?:,\d{3})?)\s*/\s*(\d{1,3}(?:,\d{3})?)"
+PLAIN_INT_RE = r"(?<![\d\.,])\b\d{2,5}(?:,\d{3})?\b(?!\.\d{2})"
+
+# Token patterns the line index matches lazily, at most once per line.
+_TOKEN_PATTERNS: Dict[str, Pattern] = {
+    "money": re.compile(MONEY_RE),
+    "bi_pair": re.compile(BI_PAIR_RE),
+    "pair": re.compile(PAIR_RE),
+    "limit": re.compile(LIMIT_RE),
+    "plain": re.compile(PLAIN_INT_RE),
+    "deductible": re.compile(r"Deductible\s*:?\s*(\$?\d{2,5}(?:,\d{3})?)", re.I),
+    # a whole-dollar amount such as 500, 1,000 or $25,000, never a premium with cents
+    # or one side of a limit pair
+    "whole": re.compile(r"(?<![\d\.,/])(?:\d{1,3}(?:,\d{3})+|\d{2,6})(?![\d,/]|\.\d)"),
+}
+
+_LIABILITY_LABEL_RE = re.compile(r"Bodily\s+Injury\s+Liability|Liability\s+to\s+Others|\A\s*Liability\s*\Z", re.I)
+_PD_LABEL_RE = re.compile(r"Property\s+Damage\s*(Liability)?\b", re.I)
+_MED_LABEL_RE = re.compile(r"Medical\s+Payments?|Med\s*Pay", re.I)
+_PIP_LABEL_RE = re.compile(r"Personal\s+Injury\s+Protection|\bPIP\b", re.I)
+_UMBI_KEYS_LOWER = tuple(k.lower() for k in UMBI_KEYS)
+_UMPD_KEYS_LOWER = tuple(k.lower() for k in UMPD_KEYS)
+
+_VIN_LINE_RE = re.compile(rf"(?:VIN[:\s#]*|)\b{VIN_RE}\b", re.I)
+_MODEL_LINE_RE = re.compile(rf"^{YEAR_RE}\s+[A-Z0-9][A-Z0-9\- ]+")
+_YEAR_MAKE_RE = re.compile(rf"^{YEAR_RE}\s+[A-Z]{2,}$")
+_MULTI_SPACE_RE = re.compile(r"\s{2,}")
+_PAIR_PAT = re.compile(PAIR_RE)
+
+_COVERAGES_START_RE = re.compile(r"\bCoverages\b", re.IGNORECASE)
+# Textract page fan-out: at most this many calls in flight per quote
+TEXTRACT_MAX_CONCURRENCY = int(os.environ.get("TEXTRACT_MAX_CONCURRENCY", "8"))
+TEXTRACT_MAX_RETRIES = 5
+TEXTRACT_BACKOFF_BASE = 0.25
+_THROTTLE_CODES = {
+    "ThrottlingException",
+    "ProvisionedThroughputExceededException",
+    "LimitExceededException",
+    "TooManyRequestsException",
+}
+
+def _is_throttle(e: Exception) -> bool:
+    code = (getattr(e, "response", None) or {}).get("Error", {}).get("Code", "")
+    return code in _THROTTLE_CODES
+
+def _textract_call(fn, **kwargs) -> Dict[str, Any]:
+    # full-jitter exponential backoff, only for throttling; other errors propagate
+    for attempt in range(TEXTRACT_MAX_RETRIES + 1):
+        try:
+            return fn(**kwargs)
+        except Exception as e:
+            if attempt == TEXTRACT_MAX_RETRIES or not _is_throttle(e):
+                raise
+            time.sleep(random.uniform(0, TEXTRACT_BACKOFF_BASE * (2 ** attempt)))
+    return {}
+
+_textract_clients: Dict[str, Any] = {}
+_textract_clients_lock = threading.Lock()
+
 def _get_textract_client(region: str = "us-east-1"):
-    if boto3 is None:
+    """
+    The process-wide Textract client for ``region``, created on first use and shared by
+    every quote and thread (boto3 clients are thread-safe). None without boto3.
+    """
+    client = _textract_clients.get(region)
+    if client is None:
+        with _textract_clients_lock:
+            client = _textract_clients.get(region)
+            if client is None:
+                try:
+                    import boto3
+                    client = boto3.client("textract", region_name=region)
+                except Exception:
+                    return None
+                _textract_clients[region] = client
+    return client
+
+def _cached_textract(kind: str, img_png_bytes: bytes, client, **kwargs) -> Optional[Dict[str, Any]]:
+    """
+    Raw Textract response for one page, served from the OCR cache when the same
+    PNG bytes were seen before. ``kind`` names the client method. None on failure.
+    Only the process-wide clients share the cache: responses of an injected client
+    (a stub, a test double) are neither read from nor written to it.
+    """
+    shared = client is None or any(client is c for c in _textract_clients.values())
+    cache = get_ocr_cache() if shared else None
+    digest = page_hash(img_png_bytes) if cache is not None else ""
+    if cache is not None:
+        resp = cache.get(kind, digest)
+        if resp is not None:
+            metrics.incr("ocr_cache_hits")
+            return resp
+        metrics.incr("ocr_cache_misses")
+    if client is None:
         return None
+    metrics.incr("textract_calls")
+    metrics.incr("ocr_bytes_sent", len(img_png_bytes))
     try:
-        return boto3.client("textract", region_name=region)
+        with metrics.stage(f"textract.{kind}"):
+            resp = _textract_call(getattr(client, kind), Document={"Bytes": img_png_bytes}, **kwargs)
     except Exception:
+        metrics.incr("textract_errors")
         return None
+    if cache is not None:
+        try:
+            cache.put(kind, digest, resp)
+        except (OSError, TypeError, ValueError):
+            pass
+    return resp
 
-def _textract_analyze_tables(img_png_bytes: bytes, client) -> List[List[List[str]]]:
-    if client is None:
-        return []
-    try:
-        resp = client.analyze_document(
-            Document={"Bytes": img_png_bytes},
-            FeatureTypes=["TABLES", "FORMS"],
-        )
-    except Exception:
-        return []
-    blocks = resp.get("Blocks", [])
-    id2block = {b["Id"]: b for b in blocks}
-    tables = []
-    for b in blocks:
-        if b.get("BlockType") != "TABLE":
-            continue
-        rows_map: Dict[int, Dict[int, str]] = {}
-        for rel in b.get("Relationships", []):
-            if rel.get("Type") != "CHILD":
-                continue
-            for cid in rel.get("Ids", []):
-                cell = id2block.get(cid)
-                if not cell or cell.get("BlockType") != "CELL":
-                    continue
-                r = cell.get("RowIndex", 0)
-                c = cell.get("ColumnIndex", 0)
-                text_parts: List[str] = []
-                for cr in cell.get("Relationships", []):
-                    if cr.get("Type") != "CHILD":
-                        continue
-                    for wid in cr.get("Ids", []):
-                        wb = id2block.get(wid)
-                        if not wb: 
-                            continue
-                        if wb.get("BlockType") == "WORD":
-                            text_parts.append(wb.get("Text",""))
-                        elif wb.get("BlockType") == "SELECTION_ELEMENT" and wb.get("SelectionStatus") == "SELECTED":
-                            text_parts.append("☑")
-                rows_map.setdefault(r, {})[c] = " ".join(text_parts).strip()
-        if rows_map:
-            maxc = max((max(cols.keys()) for cols in rows_map.values()), default=0)
-            norm: List[List[str]] = []
-            for r in sorted(rows_map.keys()):
-                norm.append([rows_map[r].get(c, "") for c in range(1, maxc+1)])
-            tables.append(norm)
-    return tables
+def _textract_analyze_page(img_png_bytes: bytes, client) -> PageParse:
+    resp = _cached_textract("analyze_document", img_png_bytes, client, FeatureTypes=["TABLES", "FORMS"])
+    if resp is None:
+        return PageParse([], [], [])
+    return parse_blocks(resp.get("Blocks", []))
 
-def _textract_detect_lines(img_png_bytes: bytes, client) -> str:
-    if client is None:
-        return ""
-    try:
-        resp = client.detect_document_text(Document={"Bytes": img_png_bytes})
-        lines = [b["Text"] for b in resp.get("Blocks", []) if b.get("BlockType") == "LINE"]
-        return "\n".join(lines)
-    except Exception:
-        return ""
+def _textract_detect_page(img_png_bytes: bytes, client) -> PageParse:
+    resp = _cached_textract("detect_document_text", img_png_bytes, client)
+    if resp is None:
+        return PageParse([], [], [])
+    return parse_blocks(resp.get("Blocks", []))
 
 def normalize_money(val: str) -> str:
     digits = re.sub(r"[^\d.]", "", val)
@@ -123,68 +184,74 @@ def normalize_money(val: str) -> str:
         return f"${amount:,.0f}"
 
 def detect_company(text: str) -> str:
-    lowered = text.lower()
-    if "progressive" in lowered: return "Progressive"
-    if "travelers" in lowered: return "Travelers"
-    if "allstate" in lowered: return "Allstate"
-    if "geico" in lowered: return "Geico"
-    if "liberty mutual" in lowered: return "Liberty Mutual"
-    if "safeco" in lowered: return "Safeco"
-    if "state farm" in lowered: return "State Farm"
-    if "nationwide" in lowered: return "Nationwide"
-    return "某保险公司"
+    return detect_profile(text).name
 
 def extract_company_name(text: str) -> str:
     return detect_company(text)
 
-def pick_pif_monthly_down(text: str) -> Dict[str, str]:
-    amts = [float(x.replace(",", "")) for x in re.findall(r"\$([\d,]+\.\d{2})", text)]
-    out: Dict[str, str] = {}
-    if len(amts) < 3:
-        return out
+_PREMIUM_MONEY_RE = re.compile(r"\$([\d,]+\.\d{2})")
+# ASCII folding finds exactly what `"savings" in text.lower()` found
+_SAVINGS_RE = re.compile("savings", re.I | re.A)
+
+def _near_savings(savings: List[int], pos: int, reach: int) -> bool:
+    # "savings" in text[max(0, pos-reach):pos+reach].lower(), given the sorted "savings" offsets
+    k = bisect_left(savings, max(0, pos - reach))
+    return k < len(savings) and savings[k] + 7 <= pos + reach
+
+def _pif_triple(amts: List[float]) -> Optional[List[float]]:
+    # the first three consecutive amounts that read as down payment < pay-in-full < monthly total
     for i in range(len(amts)-2):
         a = sorted(amts[i:i+3])
-        down, pif, monthly = a[0], a[1], a[2]
-        if down < 600 and pif < monthly:
-            out["down"] = f"${down:,.2f}"
-            out["pay_in_full"] = f"${pif:,.2f}"
-            out["monthly_total"] = f"${monthly:,.2f}"
-            break
-    return out
+        if a[0] < 600 and a[1] < a[2]:
+            return a
+    return None
 
-def extract_total_premium(text: str) -> str:
-    patterns = [
-        r"estimated\s+pay-?in-?full[\s\S]*?\$([\d,]+\.\d{2})",
-        r"pay-?in-?full[\s\S]*?\$([\d,]+\.\d{2})",
-        r"Total\s+\d+\s+month\s+policy\s+premium[\s\S]*?\$([\d,]+\.\d{2})",
-        r"your\s+estimated\s+total\s+premium[\s\S]*?\$([\d,]+\.\d{2})",
-        r"Total\s+policy\s+premium[\s\S]*?\$([\d,]+\.\d{2})",
-    ]
-    for p in patterns:
-        m = re.search(p, text, flags=re.I)
-        if m:
-            span_start = m.start()
-            guard = text[max(0, span_start-40): span_start+40].lower()
-            if "savings" in guard:
-                continue
-            return normalize_money(m.group(1))
-    pick = pick_pif_monthly_down(text)
-    if pick.get("pay_in_full"):
-        return pick["pay_in_full"]
-    amounts = [(m.group(0), m.start()) for m in re.finditer(MONEY_RE, text)]
+def _pick_pif_monthly_down(amts: List[float]) -> Dict[str, str]:
+    a = _pif_triple(amts)
+    if a is None:
+        return {}
+    return {"down": f"${a[0]:,.2f}", "pay_in_full": f"${a[1]:,.2f}", "monthly_total": f"${a[2]:,.2f}"}
+
+def pick_pif_monthly_down(text: str) -> Dict[str, str]:
+    return _pick_pif_monthly_down([float(x.replace(",", "")) for x in _PREMIUM_MONEY_RE.findall(text)])
+
+def extract_total_premium(text: str, profile: Optional[CarrierProfile] = None) -> str:
+    return money(total_premium_cents(text, profile), always_cents=True)
+
+def total_premium_cents(text: str, profile: Optional[CarrierProfile] = None) -> Optional[int]:
+    """
+    The first $x.xx after the first occurrence of a premium label (labels tried in profile
+    order, skipping one with "savings" nearby); else the pay-in-full of a down / pay-in-full /
+    monthly triple; else the largest amount of at least $1,000 not near "savings".
+    Each label costs one forward search for itself and one for the amount after it; the
+    fallbacks tokenize the amounts and "savings" offsets once, so the whole function is
+    linear in the text.
+    """
+    for label in (profile or GENERIC).premium_labels:
+        m = label.search(text)
+        if not m:
+            continue
+        amount = _PREMIUM_MONEY_RE.search(text, m.end())
+        if not amount or "savings" in text[max(0, m.start()-40): m.start()+40].lower():
+            continue
+        return to_cents(amount.group(1))
+    triple = _pif_triple([float(x.replace(",", "")) for x in _PREMIUM_MONEY_RE.findall(text)])
+    if triple is not None:
+        return round(triple[1] * 100)
+    savings = [m.start() for m in _SAVINGS_RE.finditer(text)]
     cands = []
-    for raw, pos in amounts:
+    for m in _TOKEN_PATTERNS["money"].finditer(text):
+        if _near_savings(savings, m.start(), 30):
+            continue
         try:
-            if "savings" in text[max(0, pos-30):pos+30].lower():
-                continue
-            val = float(re.sub(r"[,$]", "", raw))
+            val = float(m.group(0).replace(",", "").replace("$", ""))
             if val >= 1000:
                 cands.append(val)
         except Exception:
             pass
     if cands:
-        return f"${max(cands):,.2f}"
-    return ""
+        return round(max(cands) * 100)
+    return None
 
 def extract_policy_term(text: str) -> str:
     m = re.search(r"Total\s+(\d+)\s+month\s+policy\s+premium", text, flags=re.I)
@@ -196,208 +263,300 @@ def extract_policy_term(text: str) -> str:
         return f"{m.group(1)}个月"
     return ""
 
+# ===== Shared line index =====
+
+_UNSET = object()
+_Probe = Union[str, tuple, Pattern]
+
+class _LineIndex:
+    """
+    OCR text split into lines once. Lowered lines, canonical labels, line hits per
+    probe and the first token match per line are computed on demand and memoized,
+    so extractors reading the same text never re-split or re-scan it.
+    """
+
+    __slots__ = ("lines", "lowered", "_labels", "_tokens", "_hits")
+
+    def __init__(self, lines: Sequence[str]):
+        self.lines = list(lines)
+        self.lowered = [ln.lower() for ln in self.lines]
+        self._labels: Optional[List[str]] = None
+        self._tokens: Dict[str, list] = {}
+        self._hits: Dict[_Probe, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.lines)
+
+    @property
+    def labels(self) -> List[str]:
+        if self._labels is None:
+            self._labels = [_canon_lowered(t) for t in self.lowered]
+        return self._labels
+
+    def token(self, kind: str, i: int):
+        """First match of token ``kind`` on line ``i`` (None if absent)."""
+        row = self._tokens.get(kind)
+        if row is None:
+            row = self._tokens[kind] = [_UNSET] * len(self.lines)
+        m = row[i]
+        if m is _UNSET:
+            m = row[i] = _TOKEN_PATTERNS[kind].search(self.lines[i])
+        return m
+
+    def lines_with(self, probe: _Probe) -> List[int]:
+        """
+        Sorted indices of lines hit by ``probe``: a lowercase substring, a tuple of
+        lowercase substrings (any), or a compiled pattern searched on the raw line.
+        """
+        hits = self._hits.get(probe)
+        if hits is None:
+            if isinstance(probe, str):
+                hits = [i for i, t in enumerate(self.lowered) if probe in t]
+            elif isinstance(probe, tuple):
+                pat = re.compile("|".join(re.escape(p) for p in probe))
+                hits = [i for i, t in enumerate(self.lowered) if pat.search(t)]
+            else:
+                hits = [i for i, ln in enumerate(self.lines) if probe.search(ln)]
+            self._hits[probe] = hits
+        return hits
+
+    def first_in_window(self, kind: str, idx: int, before: int = 3, after: int = 3,
+                        lo: int = 0, hi: Optional[int] = None):
+        """First ``kind`` match scanning lines idx-before..idx+after, clipped to [lo, hi)."""
+        hi = len(self.lines) if hi is None else hi
+        for k in range(max(lo, idx - before), min(hi, idx + after + 1)):
+            m = self.token(kind, k)
+            if m:
+                return m
+        return None
+
+    def nearest(self, kind: str, idx: int, lookbehind: int = 3, lookahead: int = 3):
+        """First ``kind`` match above ``idx`` (closest first), then below; skips ``idx``."""
+        n = len(self.lines)
+        for j in range(1, lookbehind+1):
+            k = idx - j
+            if k >= 0:
+                m = self.token(kind, k)
+                if m:
+                    return m
+        for j in range(1, lookahead+1):
+            k = idx + j
+            if k < n:
+                m = self.token(kind, k)
+                if m:
+                    return m
+        return None
+
+@lru_cache(maxsize=8)
+def _line_index(text: str) -> _LineIndex:
+    return _LineIndex(text.splitlines())
+
+def _hits_in(hits: List[int], lo: int, hi: int) -> List[int]:
+    return hits[bisect_left(hits, lo):bisect_left(hits, hi)]
+
 def _window(lines: List[str], idx: int, before: int = 3, after: int = 3) -> List[str]:
     s = max(0, idx - before)
     e = min(len(lines), idx + after + 1)
     return lines[s:e]
 
-def extract_liability(text: str) -> Dict[str, Any]:
-    res = {"selected": False, "bi_per_person": "", "bi_per_accident": "", "pd": ""}
-    lines = text.splitlines()
-    for i, line in enumerate(lines):
-        if re.search(r"Bodily\s+Injury\s+Liability", line, flags=re.I) or \
-           re.search(r"Liability\s+to\s+Others", line, flags=re.I) or \
-           re.fullmatch(r"\s*Liability\s*", line, flags=re.I):
-            for w in _window(lines, i, 3, 3):
-                m = re.search(BI_PAIR_RE, w)
-                if m:
-                    res["bi_per_person"] = normalize_money(m.group(1))
-                    res["bi_per_accident"] = normalize_money(m.group(2))
-                    res["selected"] = True
-                    break
-    for i, line in enumerate(lines):
-        if re.search(r"Property\s+Damage\s*(Liability)?\b", line, flags=re.I):
-            for w in _window(lines, i, 3, 3):
-                m = re.search(MONEY_RE, w) or re.search(r"(?<![\d\.,])\b\d{2,5}(?:,\d{3})?\b(?!\.\d{2})", w)
-                if m:
-                    res["pd"] = normalize_money(m.group(0))
-                    res["selected"] = True
-                    break
+def extract_liability(text: str) -> Liability:
+    res = Liability()
+    idx = _line_index(text)
+    for i in idx.lines_with(_LIABILITY_LABEL_RE):
+        m = idx.first_in_window("bi_pair", i, 3, 3)
+        if m:
+            res.bi_per_person = to_cents(m.group(1))
+            res.bi_per_accident = to_cents(m.group(2))
+            res.selected = True
+    for i in idx.lines_with(_PD_LABEL_RE):
+        # any line with a plain integer also has a MONEY_RE match, which wins
+        m = idx.first_in_window("money", i, 3, 3)
+        if m:
+            res.pd = to_cents(m.group(0))
+            res.selected = True
     return res
 
 def _find_nearby_amount(lines: List[str], idx: int, before: int = 3, after: int = 3) -> str:
     for w in _window(lines, idx, before, after):
-        m = re.search(MONEY_RE, w)
+        m = _TOKEN_PATTERNS["money"].search(w)
         if m: return normalize_money(m.group(0))
     return ""
 
-def extract_uninsured_motorist(text: str) -> Dict[str, Any]:
-    lines = text.splitlines()
-    umb = {"selected": False, "bi_per_person": "", "bi_per_accident": "", "pd": "", "deductible": "250"}
-    for i, line in enumerate(lines):
-        if any(k.lower() in line.lower() for k in UMBI_KEYS):
-            for w in _window(lines, i, 3, 5):
-                m = re.search(BI_PAIR_RE, w)
-                if m:
-                    umb["bi_per_person"] = normalize_money(m.group(1))
-                    umb["bi_per_accident"] = normalize_money(m.group(2))
-                    umb["selected"] = True
-                    break
-    for i, line in enumerate(lines):
-        if any(k.lower() in line.lower() for k in UMPD_KEYS):
-            for w in _window(lines, i, 3, 3):
-                pm = re.search(r"(?<![\d\.,])\b\d{2,5}(?:,\d{3})?\b(?!\.\d{2})", w)
-                if pm:
-                    umb["pd"] = normalize_money(pm.group(0))
-                    umb["selected"] = True
-                    break
-    if not (umb["bi_per_person"] or umb["pd"]):
-        umb["selected"] = False
+def extract_uninsured_motorist(text: str) -> UninsuredMotorist:
+    idx = _line_index(text)
+    umb = UninsuredMotorist()
+    for i in idx.lines_with(_UMBI_KEYS_LOWER):
+        m = idx.first_in_window("bi_pair", i, 3, 5)
+        if m:
+            umb.bi_per_person = to_cents(m.group(1))
+            umb.bi_per_accident = to_cents(m.group(2))
+            umb.selected = True
+    for i in idx.lines_with(_UMPD_KEYS_LOWER):
+        pm = idx.first_in_window("plain", i, 3, 3)
+        if pm:
+            umb.pd = to_cents(pm.group(0))
+            umb.selected = True
+    if umb.bi_per_person is None and umb.pd is None:
+        umb.selected = False
     return umb
 
-def extract_medical_payment(text: str) -> Dict[str, Any]:
-    lines = text.splitlines()
-    for i, line in enumerate(lines):
-        if re.search(r"Medical\s+Payments?", line, flags=re.I) or re.search(r"Med\s*Pay", line, flags=re.I):
-            amt = _find_nearby_amount(lines, i, 3, 3)
-            if amt:
-                return {"selected": True, "med": amt}
-            else:
-                return {"selected": False, "med": ""}
-    return {"selected": False, "med": ""}
-
-def extract_personal_injury(text: str) -> Dict[str, Any]:
-    lines = text.splitlines()
-    for i, line in enumerate(lines):
-        if re.search(r"Personal\s+Injury\s+Protection|\bPIP\b", line, flags=re.I):
-            amt = _find_nearby_amount(lines, i, 3, 3)
-            if amt:
-                return {"selected": True, "pip": amt}
-            else:
-                return {"selected": False, "pip": ""}
-    return {"selected": False, "pip": ""}
+def extract_medical_payment(text: str) -> Amount:
+    idx = _line_index(text)
+    hits = idx.lines_with(_MED_LABEL_RE)
+    if hits:
+        m = idx.first_in_window("money", hits[0], 3, 3)
+        if m:
+            return Amount(True, to_cents(m.group(0)))
+    return Amount()
+
+def extract_personal_injury(text: str) -> Amount:
+    idx = _line_index(text)
+    hits = idx.lines_with(_PIP_LABEL_RE)
+    if hits:
+        m = idx.first_in_window("money", hits[0], 3, 3)
+        if m:
+            return Amount(True, to_cents(m.group(0)))
+    return Amount()
 
 def _looks_like_model(line: str) -> bool:
     s = line.strip()
     if not s: return False
-    if re.match(rf"^{YEAR_RE}\s+[A-Z0-9][A-Z0-9\- ]+", s):
+    if _MODEL_LINE_RE.match(s):
         if not any(sw in s.lower() for sw in ADDR_STOP_WORDS):
             return True
     if s.isupper() and len(s.split()) >= 2 and not any(sw in s.lower() for sw in ADDR_STOP_WORDS):
         return True
-    if re.match(rf"^{YEAR_RE}\s+[A-Z]{2,}$", s):
+    if _YEAR_MAKE_RE.match(s):
         return True
     return False
 
-def extract_vehicles(text: str) -> List[Dict[str, Any]]:
-    vehicles: List[Dict[str, Any]] = []
-    vin_pattern = re.compile(rf"(?:VIN[:\s#]*|)\b{VIN_RE}\b", re.I)
-    lines = text.splitlines()
-    for i, line in enumerate(lines):
-        m = vin_pattern.search(line)
-        if not m: continue
-        vin = m.group(1)
+def extract_vehicles(text: str) -> List[Vehicle]:
+    """
+    One entry per VIN. The text is cut once into non-overlapping vehicle regions: each
+    starts at its vehicle's model line (or VIN line) and runs to the next vehicle's,
+    at most 20 lines either side of the VIN, and coverages are read only from the
+    vehicle's own region. A VIN listed again fills what its first region lacked.
+    """
+    idx = _line_index(text)
+    lines = idx.lines
+    found = []  # (VIN line, VIN, model, first line of the vehicle)
+    for i in idx.lines_with(_VIN_LINE_RE):
+        line = lines[i]
+        vin = _VIN_LINE_RE.search(line).group(1)
         model = "未知车型"; hit = None
         for j in range(i-1, max(-1, i-6), -1):
             cand = lines[j].strip()
             if _looks_like_model(cand):
-                model, hit = re.sub(r"\s{2,}", " ", cand), j
+                model, hit = _MULTI_SPACE_RE.sub(" ", cand), j
                 break
-        if hit is not None and re.match(rf"^{YEAR_RE}\s+[A-Z]{2,}$", lines[hit].strip()) and hit+1 < len(lines):
+        if hit is not None and _YEAR_MAKE_RE.match(lines[hit].strip()) and hit+1 < len(lines):
             nxt = lines[hit+1].strip()
             if nxt.isupper() and len(nxt) >= 3:
                 model = f"{lines[hit].strip()} {nxt}"
         if model == "未知车型":
             left = line.split(vin)[0].strip()
             if _looks_like_model(left):
-                model = re.sub(r"\s{2,}", " ", left)
-        block = "\n".join(lines[max(0, i-20): min(len(lines), i+21)])
-        vehicles.append({
-            "model": model,
-            "vin": vin,
-            "collision": extract_deductible_bidirectional(block, "Collision"),
-            "comprehensive": extract_deductible_bidirectional(block, "Comprehensive"),
-            "rental": extract_limit_bidirectional(block, "Rental"),
-            "roadside": extract_presence_bidirectional(block, "Roadside Assistance"),
-        })
-    seen, out = set(), []
-    for v in vehicles:
-        if v["vin"] in seen: continue
-        seen.add(v["vin"]); out.append(v)
-    return out
+                model = _MULTI_SPACE_RE.sub(" ", left)
+        found.append((i, vin, model, i if hit is None else hit))
+
+    vehicles: Dict[str, Vehicle] = {}
+    prev_hi = 0
+    for k, (i, vin, model, _) in enumerate(found):
+        nxt = found[k+1][3] if k+1 < len(found) else len(lines)
+        lo, hi = max(prev_hi, i-20), max(i+1, min(nxt, i+21))
+        prev_hi = hi
+        region = {
+            "collision": _region_deductible(idx, "collision", lo, hi),
+            "comprehensive": _region_deductible(idx, "comprehensive", lo, hi),
+            "rental": _region_limit(idx, "rental", lo, hi),
+        }
+        roadside = _presence_in(idx, "Roadside Assistance", lo, hi)
+        v = vehicles.get(vin)
+        if v is None:
+            vehicles[vin] = Vehicle(model, vin, roadside=roadside, **region)
+            continue
+        for key, value in region.items():
+            if value.selected and not getattr(v, key).selected:
+                setattr(v, key, value)
+        v.roadside = v.roadside or roadside
+    return list(vehicles.values())
+
+def _region_value(idx: _LineIndex, keyword: str, kind: str, lo: int, hi: int):
+    # the label's own line, then the closest lines below / above it inside [lo, hi);
+    # model and VIN lines are skipped so a model year is never read as an amount
+    vins = set(_hits_in(idx.lines_with(_VIN_LINE_RE), lo, hi))
+    for i in _hits_in(idx.lines_with(keyword), lo, hi):
+        for d in range(0, 4):
+            for k in ((i,) if d == 0 else (i+d, i-d)):
+                if lo <= k < hi:
+                    m = idx.token(kind, k)
+                    if m and k not in vins and not _looks_like_model(idx.lines[k]):
+                        return m
+    return None
+
+def _region_deductible(idx: _LineIndex, keyword: str, lo: int, hi: int) -> Deductible:
+    m = _region_value(idx, keyword, "whole", lo, hi)
+    if m:
+        return Deductible(True, to_cents(m.group(0)))
+    return Deductible()
 
-def extract_deductible_bidirectional(text: str, keyword: str) -> Dict[str, Any]:
-    result = {"selected": False, "deductible": ""}
-    lines = text.splitlines()
-    for i, line in enumerate(lines):
-        if keyword.lower() in line.lower():
-            for w in _window(lines, i, 3, 3):
-                m_plain = re.search(r"(?<![\d\.,])\b\d{2,5}(?:,\d{3})?\b(?!\.\d{2})", w)
-                if m_plain:
-                    result["selected"] = True
-                    result["deductible"] = re.sub(r"[^\d]", "", m_plain.group(0))
-                    return result
-                m = re.search(r"Deductible\s*:?\\s*(\\$?\\d{2,5}(?:,\\d{3})?)", w, flags=re.I)
-                if m:
-                    result["selected"] = True
-                    result["deductible"] = re.sub(r"[^\d]", "", m.group(1))
-                    return result
-    return result
-
-def extract_limit_bidirectional(text: str, keyword: str) -> Dict[str, Any]:
-    result = {"selected": False, "limit": ""}
-    lines = text.splitlines()
-    for i, line in enumerate(lines):
-        if keyword.lower() in line.lower():
-            for w in _window(lines, i, 3, 3):
-                m = re.search(LIMIT_RE, w)
-                if m:
-                    result["selected"] = True
-                    result["limit"] = re.sub(r"\s", "", m.group(0))
-                    return result
-    return result
-
-def extract_presence_bidirectional(text: str, keyword: str) -> Dict[str, Any]:
-    lines = text.splitlines()
-    for i, line in enumerate(lines):
-        if keyword.lower() in line.lower():
-            for w in _window(lines, i, 3, 3):
-                if re.search(MONEY_RE, w) or re.search(r"\b\d{1,4}\b", w):
-                    return {"selected": True}
-            return {"selected": True}
-    if "roadside assistance coverage" in text.lower():
-        return {"selected": True}
-    return {"selected": False}
+def _region_limit(idx: _LineIndex, keyword: str, lo: int, hi: int) -> RentalLimit:
+    m = _region_value(idx, keyword, "limit", lo, hi)
+    if m:
+        return RentalLimit.parse(m.group(0))
+    return RentalLimit()
+
+def _deductible_in(idx: _LineIndex, keyword: str, lo: int, hi: int) -> Deductible:
+    for i in _hits_in(idx.lines_with(keyword.lower()), lo, hi):
+        for k in range(max(lo, i-3), min(hi, i+4)):
+            m_plain = idx.token("plain", k)
+            if m_plain:
+                return Deductible(True, to_cents(m_plain.group(0)))
+            m = idx.token("deductible", k)
+            if m:
+                return Deductible(True, to_cents(m.group(1)))
+    return Deductible()
+
+def _limit_in(idx: _LineIndex, keyword: str, lo: int, hi: int) -> RentalLimit:
+    for i in _hits_in(idx.lines_with(keyword.lower()), lo, hi):
+        m = idx.first_in_window("limit", i, 3, 3, lo, hi)
+        if m:
+            return RentalLimit.parse(m.group(0))
+    return RentalLimit()
+
+def _presence_in(idx: _LineIndex, keyword: str, lo: int, hi: int) -> bool:
+    return bool(_hits_in(idx.lines_with(keyword.lower()), lo, hi)
+                or _hits_in(idx.lines_with("roadside assistance coverage"), lo, hi))
+
+def extract_deductible_bidirectional(text: str, keyword: str) -> Deductible:
+    idx = _line_index(text)
+    return _deductible_in(idx, keyword, 0, len(idx))
+
+def extract_limit_bidirectional(text: str, keyword: str) -> RentalLimit:
+    idx = _line_index(text)
+    return _limit_in(idx, keyword, 0, len(idx))
+
+def extract_presence_bidirectional(text: str, keyword: str) -> bool:
+    idx = _line_index(text)
+    return _presence_in(idx, keyword, 0, len(idx))
 
 # ===== Linear Coverages Assembler (for messy OCR order) =====
 
-def _coverages_block_lines(text: str) -> List[str]:
-    lines = [ln.strip() for ln in text.splitlines()]
-    if not lines:
-        return []
-    start_idx = None
-    for i, ln in enumerate(lines):
-        if re.search(r"\bCoverages\b", ln, re.IGNORECASE):
-            start_idx = i
-            break
-    if start_idx is None:
+def _coverages_block_lines(text: str, profile: Optional[CarrierProfile] = None) -> List[str]:
+    idx = _line_index(text)
+    starts = idx.lines_with(_COVERAGES_START_RE)
+    if not starts:
         return []
+    start_idx = starts[0]
     # end boundary
-    end_markers = [
-        r"TOTAL\s+PER\s+VEHICLE", r"Discounts", r"Taxes\s+and\s+Fees",
-        r"Driver\s+Quote\s+Details", r"Vehicle\s+Quote\s+Details"
-    ]
-    end_idx = len(lines)
-    for i in range(start_idx+1, len(lines)):
-        seg = lines[i]
-        if any(re.search(pat, seg, re.IGNORECASE) for pat in end_markers):
-            end_idx = i
-            break
-    block = [ln for ln in lines[start_idx:end_idx] if ln]
-    return block
+    ends = idx.lines_with((profile or GENERIC).coverages_end)
+    k = bisect_left(ends, start_idx+1)
+    end_idx = ends[k] if k < len(ends) else len(idx)
+    block = [ln.strip() for ln in idx.lines[start_idx:end_idx]]
+    return [ln for ln in block if ln]
 
 def _is_limit_pair(s: str) -> bool:
-    return re.search(LIMIT_RE, s) is not None
+    return _TOKEN_PATTERNS["limit"].search(s) is not None
 
 def _is_plain_integer_amount(s: str) -> bool:
     # e.g., 25,000 or 1000 (avoid decimals)
@@ -413,27 +572,16 @@ def _is_premium_money(s: str) -> bool:
     except Exception:
         return False
 
+def _canon_lowered(t: str) -> str:
+    return GENERIC.canon(t)
+
 def _canon_label(s: str) -> str:
-    t = s.lower()
-    mapping = {
-        "liability": ["liability", "bodily injury liability", "liability to others"],
-        "property_damage": ["property damage", "property damage liability"],
-        "umbi": ["uninsured/underinsured motorists", "uninsured motorist bodily injury", "underinsured motorist bodily injury", "umbi", "uninsd/underinsd motorists"],
-        "umpd": ["uninsured/underinsured motorists pd", "uninsured motorist property damage", "underinsured motorist property damage", "umpd", "uninsd/underinsd motorists pd"],
-        "comprehensive": ["comprehensive"],
-        "collision": ["collision"],
-        "rental": ["rental"],
-        "roadside": ["roadside assistance", "roadside assistance coverage", "roadside"],
-    }
-    for k, arr in mapping.items():
-        if any(a in t for a in arr):
-            return k
-    return ""
+    return _canon_lowered(s.lower())
 
-def _parse_coverages_linear(lines: List[str]) -> Dict[str, Any]:
+def _parse_coverages_linear(lines: List[str], profile: Optional[CarrierProfile] = None) -> Dict[str, Any]:
     """
     Walk through OCR coverages block where limits/premiums may appear above or below labels.
-    Returns canonical fields.
+    Labels and window sizes come from the carrier profile. Returns canonical fields.
     """
     out = {
         "li_bi_pair": "", "li_pd": "",
@@ -441,85 +589,353 @@ def _parse_coverages_linear(lines: List[str]) -> Dict[str, Any]:
         "comp_ded": "", "coll_ded": "",
         "rental_limit": "", "roadside": False
     }
-    n = len(lines)
-    for i, ln in enumerate(lines):
-        label = _canon_label(ln)
+    profile = profile or GENERIC
+    w = profile.window
+    idx = _LineIndex(lines)
+    labels = idx.labels if profile is GENERIC else [profile.canon(t) for t in idx.lowered]
+    for i, label in enumerate(labels):
         if not label:
             continue
 
-        def grab_nearby(pattern: str, lookbehind=3, lookahead=3):
-            # search back then forward
-            for j in range(1, lookbehind+1):
-                k = i - j
-                if k >= 0 and re.search(pattern, lines[k]):
-                    return re.search(pattern, lines[k]).group(0)
-            for j in range(1, lookahead+1):
-                k = i + j
-                if k < n and re.search(pattern, lines[k]):
-                    return re.search(pattern, lines[k]).group(0)
-            return ""
-
         if label == "liability":
-            pair = grab_nearby(r"(\d{1,3}(?:,\d{3})?)\s*/\s*(\d{1,3}(?:,\d{3})?)", 3, 3)
+            pair = idx.nearest("pair", i, w, w)
             if pair:
-                out["li_bi_pair"] = pair
+                out["li_bi_pair"] = pair.group(0)
         elif label == "property_damage":
-            amt = grab_nearby(r"(?<![\d\.,])\b\d{2,5}(?:,\d{3})?\b(?!\.\d{2})", 3, 3)
+            amt = idx.nearest("plain", i, w, w)
             if amt:
-                out["li_pd"] = amt
+                out["li_pd"] = amt.group(0)
         elif label == "umbi":
-            pair = grab_nearby(r"(\d{1,3}(?:,\d{3})?)\s*/\s*(\d{1,3}(?:,\d{3})?)", 3, 3)
+            pair = idx.nearest("pair", i, w, w)
             if pair:
-                out["umbi_pair"] = pair
+                out["umbi_pair"] = pair.group(0)
         elif label == "umpd":
-            amt = grab_nearby(r"(?<![\d\.,])\b\d{2,5}(?:,\d{3})?\b(?!\.\d{2})", 3, 3)
+            amt = idx.nearest("plain", i, w, w)
             if amt:
-                out["umpd_amount"] = amt
+                out["umpd_amount"] = amt.group(0)
         elif label == "comprehensive":
-            ded = grab_nearby(r"(?<![\d\.,])\b\d{2,5}(?:,\d{3})?\b(?!\.\d{2})", 3, 3)
+            ded = idx.nearest("plain", i, w, w)
             if ded:
-                out["comp_ded"] = ded.replace(",", "")
+                out["comp_ded"] = ded.group(0).replace(",", "")
         elif label == "collision":
-            ded = grab_nearby(r"(?<![\d\.,])\b\d{2,5}(?:,\d{3})?\b(?!\.\d{2})", 3, 3)
+            ded = idx.nearest("plain", i, w, w)
             if ded:
-                out["coll_ded"] = ded.replace(",", "")
+                out["coll_ded"] = ded.group(0).replace(",", "")
         elif label == "rental":
-            lim = grab_nearby(LIMIT_RE, 4, 2)  # often appears a few lines above
+            lim = idx.nearest("limit", i, *profile.rental_window)  # often appears a few lines above
             if lim:
-                out["rental_limit"] = re.search(LIMIT_RE, lim).group(0)
+                out["rental_limit"] = lim.group(0)
         elif label == "roadside":
             out["roadside"] = True
     return out
 
-def _merge_linear_into_data(data: Dict[str, Any], linear: Dict[str, Any]) -> None:
+# canonical label -> (token kind read from its row, _parse_coverages_linear field)
+_LAYOUT_FIELDS = {
+    "liability": ("pair", "li_bi_pair"),
+    "property_damage": ("whole", "li_pd"),
+    "umbi": ("pair", "umbi_pair"),
+    "umpd": ("whole", "umpd_amount"),
+    "comprehensive": ("whole", "comp_ded"),
+    "collision": ("whole", "coll_ded"),
+    "rental": ("limit", "rental_limit"),
+}
+
+def _coverages_block_layout(layout: Sequence[LayoutLine], profile: CarrierProfile) -> List[LayoutLine]:
+    # the block is the page area between the start and end markers, not a run of reading
+    # order: OCR often reads a table column by column
+    start = next((i for i, ln in enumerate(layout) if _COVERAGES_START_RE.search(ln.text)), None)
+    if start is None:
+        return []
+    end = next((ln for ln in layout[start+1:] if profile.coverages_end.search(ln.text)), None)
+    lo = (layout[start].page, layout[start].top)
+    hi = (end.page, end.top) if end is not None else (float("inf"), 0.0)
+    return [ln for ln in layout if lo <= (ln.page, ln.middle) < hi]
+
+def _parse_coverages_layout(layout: Sequence[LayoutLine], profile: Optional[CarrierProfile] = None) -> Dict[str, Any]:
+    """
+    The fields of _parse_coverages_linear, read by geometry: each coverage label (its most
+    specific alias) takes the first value of its kind on its own line or in the cells of
+    its row, left to right. Fields with nothing aligned to their label stay empty.
+    """
+    profile = profile or GENERIC
+    out = {
+        "li_bi_pair": "", "li_pd": "",
+        "umbi_pair": "", "umpd_amount": "",
+        "comp_ded": "", "coll_ded": "",
+        "rental_limit": "", "roadside": False
+    }
+    rows = RowIndex(_coverages_block_layout(layout, profile))
+    for i, ln in enumerate(rows.lines):
+        label = profile.canon_longest(ln.text.lower())
+        if not label:
+            continue
+        if label == "roadside":
+            out["roadside"] = True
+            continue
+        kind, field = _LAYOUT_FIELDS[label]
+        for j in [i] + rows.row(i):
+            m = _TOKEN_PATTERNS[kind].search(rows.lines[j].text)
+            if m:
+                value = m.group(0)
+                out[field] = value.replace(",", "") if label in ("comprehensive", "collision") else value
+                break
+    return out
+
+def _merge_linear_into_data(data: Quote, linear: Dict[str, Any]) -> None:
+    # the block's values are matched text; each is converted to cents once, here
     if linear.get("li_bi_pair"):
-        m = re.search(r"(\d{1,3}(?:,\d{3})?)\s*/\s*(\d{1,3}(?:,\d{3})?)", linear["li_bi_pair"])
+        m = _PAIR_PAT.search(linear["li_bi_pair"])
         if m:
-            data["liability"]["bi_per_person"] = f"${m.group(1)}"
-            data["liability"]["bi_per_accident"] = f"${m.group(2)}"
-            data["liability"]["selected"] = True
+            data.liability.bi_per_person = to_cents(m.group(1))
+            data.liability.bi_per_accident = to_cents(m.group(2))
+            data.liability.selected = True
     if linear.get("li_pd"):
-        data["liability"]["pd"] = f"${linear['li_pd']}"
-        data["liability"]["selected"] = True
+        data.liability.pd = to_cents(linear["li_pd"])
+        data.liability.selected = True
 
     if linear.get("umbi_pair"):
-        m = re.search(r"(\d{1,3}(?:,\d{3})?)\s*/\s*(\d{1,3}(?:,\d{3})?)", linear["umbi_pair"])
+        m = _PAIR_PAT.search(linear["umbi_pair"])
         if m:
-            data["uninsured_motorist"]["bi_per_person"] = f"${m.group(1)}"
-            data["uninsured_motorist"]["bi_per_accident"] = f"${m.group(2)}"
-            data["uninsured_motorist"]["selected"] = True
+            data.uninsured_motorist.bi_per_person = to_cents(m.group(1))
+            data.uninsured_motorist.bi_per_accident = to_cents(m.group(2))
+            data.uninsured_motorist.selected = True
     if linear.get("umpd_amount"):
-        data["uninsured_motorist"]["pd"] = f"${linear['umpd_amount']}"
-        data["uninsured_motorist"]["selected"] = True
-
-    if data.get("vehicles"):
-        for v in data["vehicles"]:
-            if linear.get("comp_ded"):
-                v["comprehensive"] = {"selected": True, "deductible": re.sub(r"[^\d]", "", linear["comp_ded"])}
-            if linear.get("coll_ded"):
-                v["collision"] = {"selected": True, "deductible": re.sub(r"[^\d]", "", linear["coll_ded"])}
-            if linear.get("rental_limit"):
-                v["rental"] = {"selected": True, "limit": linear["rental_limit"]}
-            if linear.get("roadside"):
-                v["roadside"] = {"selected": True}
+        data.uninsured_motorist.pd = to_cents(linear["umpd_amount"])
+        data.uninsured_motorist.selected = True
+
+    # a lone vehicle owns the whole coverages block; with several, each keeps what its
+    # own region showed and the block only fills what is missing
+    vehicles = data.vehicles
+    only = len(vehicles) == 1
 
+    for v in vehicles:
+        if linear.get("comp_ded") and (only or not v.comprehensive.selected):
+            v.comprehensive = Deductible(True, to_cents(linear["comp_ded"]))
+        if linear.get("coll_ded") and (only or not v.collision.selected):
+            v.collision = Deductible(True, to_cents(linear["coll_ded"]))
+        if linear.get("rental_limit") and (only or not v.rental.selected):
+            v.rental = RentalLimit.parse(linear["rental_limit"])
+        if linear.get("roadside"):
+            v.roadside = True
+
+# ===== Quote pipeline =====
+
+def _read_upload(uploaded_file) -> bytes:
+    if isinstance(uploaded_file, (bytes, bytearray)):
+        return bytes(uploaded_file)
+    if isinstance(uploaded_file, str):
+        with open(uploaded_file, "rb") as f:
+            return f.read()
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    return uploaded_file.read()
+
+# a PDF page needs at least this many letters/digits in its text layer to skip OCR
+MIN_TEXT_LAYER_CHARS = 40
+
+def _tables_to_lines(tables: List[List[List[str]]]) -> List[str]:
+    # one line per table row keeps a coverage label next to its amount
+    return [" ".join(c for c in row if c) for table in tables for row in table if any(row)]
+
+def _key_values_to_lines(key_values: List[Tuple[str, str]]) -> List[str]:
+    # FORMS pairs such as "Policy Term: 6 months" become "key value" lines
+    return [f"{k} {v}".strip() for k, v in key_values if v]
+
+def _page_tables(page) -> List[List[List[str]]]:
+    # PyMuPDF >= 1.23 detects ruled tables from the page's vector graphics
+    try:
+        found = page.find_tables()
+    except Exception:
+        return []
+    tables = []
+    for tab in found.tables:
+        rows = [[(c or "").replace("\n", " ").strip() for c in row] for row in tab.extract()]
+        if rows:
+            tables.append(rows)
+    return tables
+
+def _page_text_layer(page) -> str:
+    """Text of a digitally generated PDF page, or "" when the page must be OCR'd."""
+    text = page.get_text("text", sort=True)
+    if sum(ch.isalnum() for ch in text) < MIN_TEXT_LAYER_CHARS:
+        return ""
+    lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
+    return "\n".join(lines + _tables_to_lines(_page_tables(page)))
+
+# OCR modes: one AnalyzeDocument call per page (lines come from its LINE blocks),
+# or the cheaper DetectDocumentText alone when tables / forms are not needed
+OCR_ANALYZE = "analyze"
+OCR_DETECT = "detect"
+DEFAULT_OCR_MODE = os.environ.get("QUOTE_OCR_MODE", OCR_ANALYZE)
+
+def _page_parse_text(page: PageParse) -> str:
+    chunks = page.lines + _tables_to_lines(page.tables) + _key_values_to_lines(page.key_values)
+    return "\n".join(c for c in chunks if c)
+
+def _ocr_pages(pages: List[bytes], client=None, max_concurrency: int = 0,
+               mode: str = "") -> List[PageParse]:
+    if not pages:
+        return []
+    if client is None:
+        client = _get_textract_client()
+    ocr_page = _textract_detect_page if (mode or DEFAULT_OCR_MODE) == OCR_DETECT else _textract_analyze_page
+    limit = max_concurrency or TEXTRACT_MAX_CONCURRENCY
+    with ThreadPoolExecutor(max_workers=max(1, min(limit, len(pages)))) as pool:
+        return list(pool.map(lambda png: ocr_page(png, client), pages))
+
+def ocr_quote_pages(pages: List[bytes], client=None, max_concurrency: int = 0,
+                    mode: str = "") -> str:
+    """
+    OCR all pages with one shared Textract client, one call per page, pages running
+    concurrently (bounded by max_concurrency, default TEXTRACT_MAX_CONCURRENCY).
+    mode is OCR_ANALYZE or OCR_DETECT (default DEFAULT_OCR_MODE); page order is preserved.
+    """
+    texts = (_page_parse_text(p) for p in _ocr_pages(pages, client, max_concurrency, mode))
+    return "\n".join(t for t in texts if t)
+
+def _ocr_mode_for(text: str, mode: str = "") -> str:
+    # an explicit mode wins; otherwise the carrier named in already-read text picks it
+    if mode:
+        return mode
+    return (detect_profile(text).ocr_mode if text else "") or DEFAULT_OCR_MODE
+
+# reasons a page was not sent to OCR
+SKIP_BLANK = "blank"
+SKIP_PROSE = "prose"   # running text: disclosures, terms, signatures
+
+class QuoteText(NamedTuple):
+    text: str
+    skipped_pages: List[Tuple[int, str]]  # (1-based page number, reason)
+    layout: Sequence[LayoutLine] = ()     # lines with page geometry, in page order
+
+def read_quote(file_bytes: bytes, client=None, use_text_layer: bool = True,
+               ocr_mode: str = "", skip_pages: bool = True, use_layout: bool = True) -> QuoteText:
+    """
+    Text of a quote file plus the pages left out of OCR. PDF pages with a usable text
+    layer are read directly with PyMuPDF. Of the rest, pages that are blank or pure
+    running text are skipped (skip_pages=False OCRs every one). The remaining
+    pages (and images) are rasterized and OCR'd; without an explicit ocr_mode the
+    carrier found in the text layer selects the mode. With use_layout the line boxes of
+    every page (text layer or Textract) are kept for parse_quote_text.
+    """
+    import fitz  # PyMuPDF
+    from utils.raster import plan_page, rasterize_image, rasterize_page
+
+    if file_bytes[:4] != b"%PDF":
+        with metrics.stage("rasterize"):
+            png = rasterize_image(file_bytes)
+        metrics.incr("pages_ocr")
+        with metrics.stage("ocr"):
+            page = _ocr_pages([png], client, mode=_ocr_mode_for("", ocr_mode))[0]
+        return QuoteText(_page_parse_text(page), [], ocr_layout(0, page.lines, page.boxes) if use_layout else ())
+    texts: List[str] = []
+    layouts: Dict[int, List[LayoutLine]] = {}
+    skipped: List[Tuple[int, str]] = []
+    raster: Dict[int, bytes] = {}
+    with fitz.open(stream=file_bytes, filetype="pdf") as pdf:
+        plans = {}
+        for i, page in enumerate(pdf):
+            with metrics.stage("text_layer"):
+                texts.append(_page_text_layer(page) if use_text_layer else "")
+            if texts[i]:
+                if use_layout:
+                    with metrics.stage("layout"):
+                        layouts[i] = pdf_layout(page, i)
+                continue
+            with metrics.stage("classify_page"):
+                plans[i] = plan = plan_page(page)
+            if skip_pages and plan.clip is None:
+                skipped.append((i + 1, SKIP_BLANK))
+            elif skip_pages and plan.prose:
+                skipped.append((i + 1, SKIP_PROSE))
+        skipped_at = {n - 1 for n, _ in skipped}
+        for i, plan in plans.items():
+            if i not in skipped_at:
+                with metrics.stage("rasterize"):
+                    raster[i] = rasterize_page(pdf[i], plan=plan)
+    metrics.incr("pages_text_layer", len(texts) - len(plans))
+    metrics.incr("pages_skipped", len(skipped))
+    metrics.incr("pages_ocr", len(raster))
+    with metrics.stage("ocr"):
+        mode = _ocr_mode_for("\n".join(texts), ocr_mode) if raster else ""
+        parses = _ocr_pages(list(raster.values()), client, mode=mode)
+    for i, page in zip(raster, parses):
+        texts[i] = _page_parse_text(page)
+        if use_layout:
+            layouts[i] = ocr_layout(i, page.lines, page.boxes)
+    layout = [ln for i in sorted(layouts) for ln in layouts[i]]
+    return QuoteText("\n".join(t for t in texts if t), skipped, layout)
+
+def quote_text(file_bytes: bytes, client=None, use_text_layer: bool = True,
+               ocr_mode: str = "", skip_pages: bool = True) -> str:
+    """Full text of a quote file; see read_quote."""
+    return read_quote(file_bytes, client, use_text_layer, ocr_mode, skip_pages).text
+
+# bump whenever a change to the extractors changes what parse_quote_text returns;
+# cached results of other versions are then ignored (see utils.parse_cache replay)
+PARSER_VERSION = 3
+
+_TEXT_FIELDS = [
+    ("policy_term", extract_policy_term),
+    ("liability", extract_liability),
+    ("uninsured_motorist", extract_uninsured_motorist),
+    ("medical_payment", extract_medical_payment),
+    ("personal_injury", extract_personal_injury),
+    ("vehicles", extract_vehicles),
+]
+
+def parse_quote_text(text: str, layout: Optional[Sequence[LayoutLine]] = None) -> Quote:
+    # one scan picks the carrier profile; its rules drive the premium and coverages passes
+    with metrics.stage("detect_company"):
+        profile = detect_profile(text)
+    data = Quote(profile.name)
+    with metrics.stage("extract_total_premium"):
+        data.total_premium = total_premium_cents(text, profile)
+    for key, extract in _TEXT_FIELDS:
+        with metrics.stage(extract.__name__):
+            setattr(data, key, extract(text))
+    data.policy_term = data.policy_term or DEFAULT_POLICY_TERM
+    with metrics.stage("_parse_coverages_linear"):
+        linear = _parse_coverages_linear(_coverages_block_lines(text, profile), profile)
+    if layout:
+        # values aligned with their label win; the line-window guesses fill the rest
+        with metrics.stage("_parse_coverages_layout"):
+            placed = _parse_coverages_layout(layout, profile)
+        linear.update((k, v) for k, v in placed.items() if v)
+    with metrics.stage("_merge_linear_into_data"):
+        _merge_linear_into_data(data, linear)
+    return data
+
+def parse_quote_cached(text: str, layout: Optional[Sequence[LayoutLine]] = None) -> Quote:
+    """parse_quote_text memoized on the normalized text, its layout and PARSER_VERSION."""
+    text = normalize_text(text)
+    cache = get_parse_cache(PARSER_VERSION)
+    if cache is None:
+        return parse_quote_text(text, layout)
+    with metrics.stage("parse_cache_key"):
+        digest = text_fingerprint(text, layout)
+    stored = cache.get(digest)
+    if stored is not None:
+        metrics.incr("parse_cache_hits")
+        return Quote.from_dict(stored)
+    metrics.incr("parse_cache_misses")
+    data = parse_quote_text(text, layout)
+    cache.put(digest, data.to_dict(), text, layout)
+    return data
+
+def extract_quote_data(uploaded_file, return_raw_text: bool = False, client=None,
+                       use_text_layer: bool = True, ocr_mode: str = "", skip_pages: bool = True,
+                       use_layout: bool = True):
+    """
+    Read an uploaded quote (PDF / image, file-like, bytes or path) and parse it into the
+    Quote consumed by generate_policy_docx (Quote.to_dict() for JSON). use_text_layer=False
+    forces Textract on every page. Pages left out of OCR are listed in skipped_pages.
+    use_layout=False reads coverages from line order only, ignoring page geometry.
+    """
+    quote = read_quote(_read_upload(uploaded_file), client, use_text_layer, ocr_mode, skip_pages, use_layout)
+    text = quote.text
+    data = parse_quote_cached(text, quote.layout)
+    data.skipped_pages = list(quote.skipped_pages)
+    if return_raw_text:
+        return data, text
+    return data
@@ -0,0 +1,218 @@
+"""
+Typed quote model.
+
+Parsed quotes are small slotted dataclasses with every amount held as integer
+cents (None when the quote does not show it), so the pipeline never formats an
+amount and parses it back. Text is produced once: by money() when a policy is
+rendered, and by Quote.to_dict() for the JSON consumers (batch output, the
+HTTP service, the parse cache), which keeps the historical shape:
+
+    {"company", "total_premium", "policy_term", "liability", "uninsured_motorist",
+     "medical_payment", "personal_injury", "vehicles"[, "skipped_pages"]}
+
+Quote.from_dict() reads that shape back, so from_dict(q.to_dict()) == q.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.carriers import DEFAULT_COMPANY
+
+DEFAULT_POLICY_TERM = "6个月"
+UM_DEDUCTIBLE = 25000  # $250
+
+_NOT_AMOUNT_RE = re.compile(r"[^\d.]")
+
+
+def to_cents(val: str) -> Optional[int]:
+    """Cents of an amount as printed ("$1,234.56", "25,000", "500"); None when it holds no digits."""
+    digits = _NOT_AMOUNT_RE.sub("", val)
+    if not digits:
+        return None
+    if "." in digits:
+        return round(float(digits) * 100)
+    return int(digits) * 100
+
+
+def money(cents: Optional[int], always_cents: bool = False) -> str:
+    """"$25,000", or "$1,234.56" when there are cents (always with always_cents); "" for None."""
+    if cents is None:
+        return ""
+    dollars, rest = divmod(cents, 100)
+    if rest or always_cents:
+        return f"${dollars:,}.{rest:02d}"
+    return f"${dollars:,}"
+
+
+def dollars(cents: Optional[int]) -> str:
+    """Bare whole dollars, as deductibles are printed: "500"; "" for None."""
+    return "" if cents is None else str(cents // 100)
+
+
+def _cents_or_none(val: str) -> Optional[int]:
+    return to_cents(val) if val else None
+
+
+@dataclass(slots=True)
+class Liability:
+    selected: bool = False
+    bi_per_person: Optional[int] = None
+    bi_per_accident: Optional[int] = None
+    pd: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"selected": self.selected, "bi_per_person": money(self.bi_per_person),
+                "bi_per_accident": money(self.bi_per_accident), "pd": money(self.pd)}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Liability":
+        return cls(d.get("selected", False), _cents_or_none(d.get("bi_per_person", "")),
+                   _cents_or_none(d.get("bi_per_accident", "")), _cents_or_none(d.get("pd", "")))
+
+
+@dataclass(slots=True)
+class UninsuredMotorist:
+    selected: bool = False
+    bi_per_person: Optional[int] = None
+    bi_per_accident: Optional[int] = None
+    pd: Optional[int] = None
+    deductible: Optional[int] = UM_DEDUCTIBLE
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"selected": self.selected, "bi_per_person": money(self.bi_per_person),
+                "bi_per_accident": money(self.bi_per_accident), "pd": money(self.pd),
+                "deductible": dollars(self.deductible)}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "UninsuredMotorist":
+        return cls(d.get("selected", False), _cents_or_none(d.get("bi_per_person", "")),
+                   _cents_or_none(d.get("bi_per_accident", "")), _cents_or_none(d.get("pd", "")),
+                   _cents_or_none(d["deductible"]) if "deductible" in d else UM_DEDUCTIBLE)
+
+
+@dataclass(slots=True)
+class Amount:
+    """A single-limit coverage (medical payments, personal injury protection)."""
+    selected: bool = False
+    amount: Optional[int] = None
+
+    def to_dict(self, key: str) -> Dict[str, Any]:
+        return {"selected": self.selected, key: money(self.amount)}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any], key: str) -> "Amount":
+        return cls(d.get("selected", False), _cents_or_none(d.get(key, "")))
+
+
+@dataclass(slots=True)
+class Deductible:
+    selected: bool = False
+    deductible: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"selected": self.selected, "deductible": dollars(self.deductible)}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Deductible":
+        return cls(d.get("selected", False), _cents_or_none(d.get("deductible", "")))
+
+
+@dataclass(slots=True)
+class RentalLimit:
+    """Rental reimbursement: per day / per claim, printed as quotes print it, "30/900" or "40/1200"."""
+    selected: bool = False
+    per_day: Optional[int] = None
+    per_claim: Optional[int] = None
+    grouped: bool = False  # the quote printed thousands separators ("1,000/30,000")
+
+    @property
+    def limit(self) -> str:
+        if self.per_day is None or self.per_claim is None:
+            return ""
+        if self.grouped:
+            return f"{self.per_day // 100:,}/{self.per_claim // 100:,}"
+        return f"{self.per_day // 100}/{self.per_claim // 100}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"selected": self.selected, "limit": self.limit}
+
+    @classmethod
+    def parse(cls, limit: str) -> "RentalLimit":
+        """A selected limit from text such as "30/900" or "1,000/30,000"."""
+        day, _, claim = limit.partition("/")
+        return cls(True, to_cents(day), to_cents(claim), "," in limit)
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "RentalLimit":
+        limit = d.get("limit", "")
+        if not limit:
+            return cls(d.get("selected", False))
+        r = cls.parse(limit)
+        r.selected = d.get("selected", False)
+        return r
+
+
+@dataclass(slots=True)
+class Vehicle:
+    model: str
+    vin: str
+    collision: Deductible = field(default_factory=Deductible)
+    comprehensive: Deductible = field(default_factory=Deductible)
+    rental: RentalLimit = field(default_factory=RentalLimit)
+    roadside: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"model": self.model, "vin": self.vin, "collision": self.collision.to_dict(),
+                "comprehensive": self.comprehensive.to_dict(), "rental": self.rental.to_dict(),
+                "roadside": {"selected": self.roadside}}
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Vehicle":
+        return cls(d.get("model", ""), d.get("vin", ""),
+                   Deductible.from_dict(d.get("collision", {})),
+                   Deductible.from_dict(d.get("comprehensive", {})),
+                   RentalLimit.from_dict(d.get("rental", {})),
+                   d.get("roadside", {}).get("selected", False))
+
+
+@dataclass(slots=True)
+class Quote:
+    company: str = DEFAULT_COMPANY
+    total_premium: Optional[int] = None
+    policy_term: str = DEFAULT_POLICY_TERM
+    liability: Liability = field(default_factory=Liability)
+    uninsured_motorist: UninsuredMotorist = field(default_factory=UninsuredMotorist)
+    medical_payment: Amount = field(default_factory=Amount)
+    personal_injury: Amount = field(default_factory=Amount)
+    vehicles: List[Vehicle] = field(default_factory=list)
+    skipped_pages: Optional[List[Tuple[int, str]]] = None  # (page, reason); None until the file was read
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = {
+            "company": self.company,
+            "total_premium": money(self.total_premium, always_cents=True),
+            "policy_term": self.policy_term,
+            "liability": self.liability.to_dict(),
+            "uninsured_motorist": self.uninsured_motorist.to_dict(),
+            "medical_payment": self.medical_payment.to_dict("med"),
+            "personal_injury": self.personal_injury.to_dict("pip"),
+            "vehicles": [v.to_dict() for v in self.vehicles],
+        }
+        if self.skipped_pages is not None:
+            d["skipped_pages"] = [{"page": n, "reason": r} for n, r in self.skipped_pages]
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Quote":
+        skipped = d.get("skipped_pages")
+        return cls(
+            d.get("company", DEFAULT_COMPANY),
+            _cents_or_none(d.get("total_premium", "")),
+            d.get("policy_term", DEFAULT_POLICY_TERM),
+            Liability.from_dict(d.get("liability", {})),
+            UninsuredMotorist.from_dict(d.get("uninsured_motorist", {})),
+            Amount.from_dict(d.get("medical_payment", {}), "med"),
+            Amount.from_dict(d.get("personal_injury", {}), "pip"),
+            [Vehicle.from_dict(v) for v in d.get("vehicles", ())],
+            None if skipped is None else [(p["page"], p["reason"]) for p in skipped],
+        )
@@ -0,0 +1,202 @@
+"""
+Page rasterization for OCR.
+
+Every page is planned from a cheap grayscale thumbnail before it is rendered:
+the ink bounding box gives the crop (blank margins are dropped), the share of
+the page covered by ink gives the text density and so the DPI, and the pixel
+budget is worked out up front so the PNG can never exceed Textract's
+synchronous byte limit. Pages are rendered grayscale, or 1-bit with
+QUOTE_RASTER=bw.
+
+Pages of running text (disclosures, terms, letters) are flagged from a second,
+finer render of the ink box, split into text lines. A page counts as prose only
+when every line could be nothing else: no column gutter, no word as long as a
+VIN, and no short line except the last line of a paragraph. A single coverage
+row, VIN line or heading anywhere on the page keeps it in OCR.
+"""
+import io
+import math
+import os
+from typing import List, NamedTuple, Optional, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+TEXTRACT_MAX_BYTES = 10 * 1024 * 1024  # AnalyzeDocument / DetectDocumentText with Bytes
+TEXTRACT_MAX_SIDE = 10000
+
+DPI_MIN = 100
+DPI_SPARSE = 150  # large print, mostly whitespace
+DPI_DENSE = 200   # small print, tables
+DENSE_INK = 0.05  # share of the page's thumbnail pixels that are ink
+THUMB_DPI = 36
+INK_LEVEL = 200   # gray values below this count as ink
+BW_LEVEL = 160    # threshold for 1-bit output
+MARGIN_PT = 6
+PROSE_DPI = 100         # word spaces are 3-4 px at body text sizes
+PROSE_MIN_LINES = 6
+# in multiples of the page's median line height
+PROSE_MAX_LINE = 1.8    # taller: merged lines, a logo, a large heading
+PROSE_MAX_GUTTER = 1.2  # wider blank run inside a line: a column gutter
+PROSE_WORD_GAP = 0.2    # blank runs at least this wide separate words
+PROSE_MAX_WORD = 8.5    # a 17-character VIN is 9.5-11, "responsibilities" about 8
+PROSE_FULL_LINE = 0.75  # share of the text width a line must fill unless it ends a paragraph
+PROSE_PARA_PITCH = 1.4  # line pitch, over the median pitch, that starts a new paragraph
+PROSE_FOLIO = 0.2       # a set-apart first or last line narrower than this share is a page number
+
+COLOR_GRAY = "gray"
+COLOR_BW = "bw"
+DEFAULT_COLOR = os.environ.get("QUOTE_RASTER", COLOR_GRAY)
+
+
+class PagePlan(NamedTuple):
+    dpi: int
+    clip: Optional[fitz.Rect]  # None renders the whole page
+    ink: float
+    prose: bool
+
+
+def _png_bound(width: int, height: int, color: str) -> int:
+    # stored (uncompressed) deflate is the worst case: raw rows plus a filter byte each,
+    # 5 bytes per 64 KiB block and a few hundred bytes of chunk headers
+    row = (width + 7) // 8 if color == COLOR_BW else width
+    raw = height * (row + 1)
+    return raw + 5 * (raw // 65535 + 1) + 1024
+
+
+def fit_scale(width: float, height: float, scale: float, color: str = DEFAULT_COLOR) -> float:
+    """Largest scale <= ``scale`` whose PNG of a width x height area stays inside the Textract limits."""
+    side = max(width, height) * scale
+    if side > TEXTRACT_MAX_SIDE:
+        scale *= TEXTRACT_MAX_SIDE / side
+    while scale > 0.05 and _png_bound(math.ceil(width * scale), math.ceil(height * scale), color) > TEXTRACT_MAX_BYTES:
+        scale *= 0.95
+    return scale
+
+
+def _ink_mask(img: Image.Image) -> Image.Image:
+    return img.point(lambda v: 255 if v < INK_LEVEL else 0)
+
+
+def _ink_box(img: Image.Image) -> Tuple[Optional[Tuple[int, int, int, int]], float]:
+    mask = _ink_mask(img)
+    box = mask.getbbox()
+    if box is None:
+        return None, 0.0
+    return box, mask.histogram()[255] / (img.width * img.height)
+
+
+def _runs(flags: bytes) -> List[Tuple[int, int]]:
+    # [start, end) of the runs of non-zero bytes
+    runs = []
+    start = None
+    for i, v in enumerate(flags):
+        if v and start is None:
+            start = i
+        elif not v and start is not None:
+            runs.append((start, i))
+            start = None
+    if start is not None:
+        runs.append((start, len(flags)))
+    return runs
+
+
+def _is_prose(mask: Image.Image) -> bool:
+    width = mask.width
+    data = mask.tobytes()
+    rows = bytes(1 if data.count(0, y * width, (y + 1) * width) < width else 0 for y in range(mask.height))
+    lines = _runs(rows)
+    if len(lines) < PROSE_MIN_LINES:
+        return False
+    height = sorted(y1 - y0 for y0, y1 in lines)[len(lines) // 2]
+    spans = []
+    for y0, y1 in lines:
+        if y1 - y0 > PROSE_MAX_LINE * height:
+            return False
+        # columns of the line as rows, so each one is counted the same way
+        line = mask.crop((0, y0, width, y1)).transpose(Image.Transpose.ROTATE_90)
+        cols = line.tobytes()
+        inked = bytes(1 if cols.count(0, x * line.width, (x + 1) * line.width) < line.width else 0
+                      for x in range(line.height))[::-1]
+        ink = _runs(inked)
+        x0, x1 = ink[0][0], ink[-1][1]
+        word_start = x0
+        for (_, end), (start, _) in zip(ink, ink[1:]):
+            gap = start - end
+            if gap > PROSE_MAX_GUTTER * height:
+                return False
+            if gap >= max(2, PROSE_WORD_GAP * height):
+                if end - word_start > PROSE_MAX_WORD * height:
+                    return False
+                word_start = start
+        if x1 - word_start > PROSE_MAX_WORD * height:
+            return False
+        spans.append((x0, x1, (y0 + y1) / 2))
+    text_width = max(x1 for _, x1, _ in spans) - min(x0 for x0, _, _ in spans)
+    pitches = [b[2] - a[2] for a, b in zip(spans, spans[1:])]
+    pitch = sorted(pitches)[len(pitches) // 2]
+    full = 0
+    for i, (x0, x1, _) in enumerate(spans):
+        if x1 - x0 >= PROSE_FULL_LINE * text_width:
+            full += 1
+            continue
+        # a short line is only the end of a paragraph: a full line just above it, a break (or nothing) below
+        starts_para = i == 0 or pitches[i - 1] > PROSE_PARA_PITCH * pitch
+        ends_para = i == len(spans) - 1 or pitches[i] > PROSE_PARA_PITCH * pitch
+        if (i == 0 and ends_para or i == len(spans) - 1 and starts_para) and x1 - x0 < PROSE_FOLIO * text_width:
+            continue
+        above = spans[i - 1] if i else None
+        if starts_para or not ends_para or above[1] - above[0] < PROSE_FULL_LINE * text_width:
+            return False
+    return full >= PROSE_MIN_LINES
+
+
+def plan_page(page, color: str = DEFAULT_COLOR) -> PagePlan:
+    s = THUMB_DPI / 72
+    thumb = page.get_pixmap(matrix=fitz.Matrix(s, s), colorspace=fitz.csGRAY, alpha=False)
+    mask = _ink_mask(Image.frombytes("L", (thumb.width, thumb.height), thumb.samples))
+    box = mask.getbbox()
+    if box is None:
+        return PagePlan(DPI_MIN, None, 0.0, False)
+    ink = mask.histogram()[255] / (thumb.width * thumb.height)
+    clip = fitz.Rect(box[0] / s - MARGIN_PT, box[1] / s - MARGIN_PT,
+                     box[2] / s + MARGIN_PT, box[3] / s + MARGIN_PT) & page.rect
+    dpi = DPI_DENSE if ink >= DENSE_INK else DPI_SPARSE
+    dpi = int(fit_scale(clip.width, clip.height, dpi / 72, color) * 72)
+    z = PROSE_DPI / 72
+    fine = page.get_pixmap(matrix=fitz.Matrix(z, z), clip=clip, colorspace=fitz.csGRAY, alpha=False)
+    prose = _is_prose(_ink_mask(Image.frombytes("L", (fine.width, fine.height), fine.samples)))
+    return PagePlan(dpi, clip, ink, prose)
+
+
+def _encode(img: Image.Image, color: str) -> bytes:
+    if color == COLOR_BW:
+        img = img.point(lambda v: 255 if v >= BW_LEVEL else 0, mode="1")
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def rasterize_page(page, color: str = DEFAULT_COLOR, plan: Optional[PagePlan] = None) -> bytes:
+    """PNG of one PDF page, cropped to its ink and rendered at a DPI chosen from its text density."""
+    plan = plan or plan_page(page, color)
+    z = plan.dpi / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(z, z), clip=plan.clip, colorspace=fitz.csGRAY, alpha=False)
+    if color == COLOR_BW:
+        return _encode(Image.frombytes("L", (pix.width, pix.height), pix.samples), color)
+    return pix.tobytes("png")
+
+
+def rasterize_image(file_bytes: bytes, color: str = DEFAULT_COLOR) -> bytes:
+    """PNG of an uploaded photo or scan: grayscale, margins cropped, downscaled only to fit the limits."""
+    img = Image.open(io.BytesIO(file_bytes))
+    img = img.convert("L")
+    box, _ = _ink_box(img)
+    if box is not None:
+        pad = max(1, min(img.size) // 100)
+        img = img.crop((max(0, box[0] - pad), max(0, box[1] - pad),
+                        min(img.width, box[2] + pad), min(img.height, box[3] + pad)))
+    scale = fit_scale(img.width, img.height, 1.0, color)
+    if scale < 1.0:
+        img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS)
+    return _encode(img, color)
@@ -0,0 +1,277 @@
+"""
+报价解析 HTTP 服务（JSON），给 CRM 等后端调用。
+
+    python -m utils.service --port 8080 --workers 4 --queue 16
+    python -m utils.service --stub-ocr quote_text.txt   # 本地测试，不调用 Textract
+
+    POST /parse     请求体 = 报价文件原始字节（PDF / 图片），返回解析结果 JSON；
+                    Content-Type 为 text/plain 时请求体当作 OCR 文本，只做解析
+    POST /policy    同上，返回生成的中文保单 .docx
+    GET  /healthz   {"ok": true, "busy": 正在处理 + 排队的请求数, "capacity": 上限}
+    GET  /metrics   Prometheus 文本
+
+查询参数（与 utils.batch 的命令行选项对应）：ocr_only=1、ocr_mode=analyze|detect、all_pages=1、no_layout=1。
+
+解析和生成在固定大小的线程池里执行（Textract 调用是网络 I/O，线程足够），池满后最多再排队
+--queue 个请求，超出立即返回 429 并带 Retry-After，由负载均衡把请求分给其他实例。
+每个进程只创建一个 Textract 客户端，所有请求共用。
+"""
+import argparse
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from utils import metrics
+from utils.batch import DEFAULT_TEMPLATE
+
+MAX_BODY_BYTES = 50 * 1024 * 1024
+RETRY_AFTER_SECONDS = 2
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+class Busy(Exception):
+    """线程池和队列都已占满。"""
+
+
+class StubTextract:
+    """
+    不联网的 Textract 替身：每一页都识别成同一段文字（每行一个 LINE 块，按行均匀排列）。
+    注入的客户端不读写 OCR 缓存，替身的结果不会混进真实页面的缓存。
+    """
+
+    def __init__(self, text: str = ""):
+        lines = [ln for ln in text.splitlines() if ln.strip()]
+        step = 1.0 / max(len(lines), 1)
+        self.calls = 0
+        self._resp = {"Blocks": [
+            {"Id": f"line-{i}", "BlockType": "LINE", "Text": ln,
+             "Geometry": {"BoundingBox": {"Left": 0.05, "Top": i * step, "Width": 0.9, "Height": step * 0.8}}}
+            for i, ln in enumerate(lines)
+        ]}
+
+    def _respond(self, **kwargs) -> Dict[str, Any]:
+        self.calls += 1
+        return self._resp
+
+    analyze_document = _respond
+    detect_document_text = _respond
+
+
+class QuoteService:
+    def __init__(self, workers: int = 4, queue: int = 16, template_path: str = DEFAULT_TEMPLATE, client=None):
+        from utils.parse_quote import _get_textract_client
+
+        self.workers = workers
+        self.capacity = workers + queue
+        self.template_path = template_path
+        self.client = client if client is not None else _get_textract_client()
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="quote")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._busy = 0
+        self._lock = threading.Lock()
+
+    @property
+    def busy(self) -> int:
+        return self._busy
+
+    def _release(self, _future) -> None:
+        with self._lock:
+            self._busy -= 1
+        self._slots.release()
+
+    def run(self, fn, *args):
+        """在线程池里执行 fn(*args) 并等待结果；池和队列都满时抛出 Busy。"""
+        if not self._slots.acquire(blocking=False):
+            metrics.incr("http_rejected")
+            raise Busy()
+        with self._lock:
+            self._busy += 1
+        try:
+            future = self._pool.submit(fn, *args)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future.result()
+
+    def parse(self, body: bytes, content_type: str, options: Dict[str, Any]):
+        from utils.parse_quote import extract_quote_data, parse_quote_cached
+
+        if content_type == "text/plain":
+            data = parse_quote_cached(body.decode("utf-8", "replace"))
+            data.skipped_pages = []
+            return data
+        return extract_quote_data(body, client=self.client, **options)
+
+    def policy(self, body: bytes, content_type: str, options: Dict[str, Any]) -> bytes:
+        from utils.generate_policy import render_policy_docx
+        from utils.templates import load_template
+
+        data = self.parse(body, content_type, options)
+        return render_policy_docx(load_template(self.template_path), data).getvalue()
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=True)
+
+
+def _flag(query: Dict[str, List[str]], name: str) -> bool:
+    return query.get(name, [""])[-1].lower() in ("1", "true", "yes", "on")
+
+
+def request_options(query: Dict[str, List[str]]) -> Dict[str, Any]:
+    """查询参数 -> extract_quote_data 的关键字参数。"""
+    mode = query.get("ocr_mode", [""])[-1]
+    if mode not in ("", "analyze", "detect"):
+        raise ValueError(f"unknown ocr_mode: {mode}")
+    return {
+        "use_text_layer": not _flag(query, "ocr_only"),
+        "ocr_mode": mode,
+        "skip_pages": not _flag(query, "all_pages"),
+        "use_layout": not _flag(query, "no_layout"),
+    }
+
+
+class QuoteHandler(BaseHTTPRequestHandler):
+    server_version = "chinesequote"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self) -> QuoteService:
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Tuple[Tuple[str, str], ...] = ()) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in headers:
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, obj: Any, headers: Tuple[Tuple[str, str], ...] = ()) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self._send(status, body, "application/json; charset=utf-8", headers)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/healthz":
+            self._json(200, {"ok": True, "busy": self.service.busy, "capacity": self.service.capacity})
+        elif path == "/metrics":
+            self._send(200, metrics.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4")
+        else:
+            self._json(404, {"error": "not found"})
+
+    def _read_body(self) -> Optional[bytes]:
+        try:
+            size = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            # without a length the rest of the stream cannot be framed; do not parse it as a request
+            self.close_connection = True
+            self._json(411, {"error": "Content-Length required"})
+            return None
+        if size < 0:
+            # rfile.read(-1) would read until the client closes the connection
+            self.close_connection = True
+            self._json(400, {"error": "invalid Content-Length"})
+            return None
+        if size > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._json(413, {"error": f"body larger than {MAX_BODY_BYTES} bytes"})
+            return None
+        body = self.rfile.read(size)
+        if not body:
+            self._json(400, {"error": "empty body"})
+            return None
+        if len(body) < size:
+            self.close_connection = True
+            self._json(400, {"error": f"body shorter than Content-Length ({len(body)} < {size})"})
+            return None
+        return body
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path not in ("/parse", "/policy"):
+            self._json(404, {"error": "not found"})
+            return
+        body = self._read_body()
+        if body is None:
+            return
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        try:
+            options = request_options(parse_qs(url.query))
+        except ValueError as e:
+            self._json(400, {"error": str(e)})
+            return
+        metrics.incr("http_requests")
+        fn = self.service.parse if url.path == "/parse" else self.service.policy
+        try:
+            with metrics.stage(f"http{url.path.replace('/', '.')}"):
+                result = self.service.run(fn, body, content_type, options)
+        except Busy:
+            self._json(429, {"error": "busy"}, (("Retry-After", str(RETRY_AFTER_SECONDS)),))
+            return
+        except Exception as e:
+            metrics.incr("http_errors")
+            self._json(500, {"error": str(e)})
+            return
+        if url.path == "/parse":
+            self._json(200, result.to_dict())
+        else:
+            self._send(200, result, DOCX_TYPE, (("Content-Disposition", 'attachment; filename="policy.docx"'),))
+
+
+class QuoteServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: QuoteService, quiet: bool = False):
+        super().__init__(address, QuoteHandler)
+        self.service = service
+        self.quiet = quiet
+
+
+def make_server(host: str = "127.0.0.1", port: int = 8080, workers: int = 4, queue: int = 16,
+                template_path: str = DEFAULT_TEMPLATE, client=None, quiet: bool = False) -> QuoteServer:
+    """建好服务但不启动；port=0 时由系统分配端口（见 server.server_address）。"""
+    return QuoteServer((host, port), QuoteService(workers, queue, template_path, client), quiet)
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="保险报价解析 / 中文保单生成 HTTP 服务")
+    ap.add_argument("--host", default="127.0.0.1", help="监听地址（容器内用 0.0.0.0）")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("-w", "--workers", type=int, default=4, help="同时处理的请求数")
+    ap.add_argument("-q", "--queue", type=int, default=16, help="线程池满后最多排队的请求数，超出返回 429")
+    ap.add_argument("-t", "--template", default=DEFAULT_TEMPLATE, help="Word 模板路径")
+    ap.add_argument("--stub-ocr", metavar="TEXT_FILE",
+                    help="不调用 Textract，每一页都当作识别出这个文件里的文字（本地测试用）")
+    ap.add_argument("--quiet", action="store_true", help="不打印访问日志")
+    args = ap.parse_args(argv)
+
+    metrics.enable()
+    client = None
+    if args.stub_ocr:
+        with open(args.stub_ocr, encoding="utf-8") as f:
+            client = StubTextract(f.read())
+    server = make_server(args.host, args.port, args.workers, args.queue, args.template, client, args.quiet)
+    host, port = server.server_address[:2]
+    print(f"监听 http://{host}:{port}（{args.workers} 个工作线程，队列 {args.queue}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.service.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""
+Word 模板缓存：每个模板只从磁盘解析一次，之后每次请求拿到一个廉价副本。
+
+副本只深拷贝正文部件 (word/document.xml)；样式、主题、图片等只读部件在副本之间共享。
+文件的 mtime 或大小变化时自动重新加载。
+"""
+import copy
+import os
+import threading
+from typing import Dict, Tuple
+
+from docx import Document
+
+from utils import metrics
+
+
+def clone_document(doc):
+    # 预先放进 memo 的对象会被 deepcopy 原样复用，因此只有正文部件和包结构被复制
+    memo = {}
+    for part in doc.part.package.iter_parts():
+        if part is not doc.part:
+            memo[id(part)] = part
+    return copy.deepcopy(doc, memo)
+
+
+class TemplateRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[Tuple[int, int], object]] = {}  # 路径 -> ((mtime_ns, size), 原始文档)
+        self.loads = 0
+
+    def _pristine(self, path: str):
+        key = os.path.abspath(path)
+        st = os.stat(key)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            hit = self._cache.get(key)
+            if hit is not None and hit[0] == stamp:
+                return hit[1]
+        with metrics.stage("template_load"):
+            doc = Document(key)
+        with self._lock:
+            self._cache[key] = (stamp, doc)
+            self.loads += 1
+        return doc
+
+    def get(self, path: str):
+        """返回模板的独立副本，可以随意修改和保存。"""
+        with metrics.stage("template_clone"):
+            return clone_document(self._pristine(path))
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+default_registry = TemplateRegistry()
+
+
+def load_template(path: str):
+    return default_registry.get(path)
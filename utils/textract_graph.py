@@ -0,0 +1,107 @@
+"""
+Index over a Textract Blocks response.
+
+Blocks are addressed by ordinal (their position in the response). A single walk
+over every block maps Ids to ordinals, collects LINE text and bounding boxes in
+reading order and records the ordinals of TABLE and FORMS KEY blocks. Tables
+and key/value pairs are then built by following only those blocks'
+relationships, so a page's WORD blocks are touched once, by the cell or key
+that owns them, and the FORMS output requested from AnalyzeDocument comes out
+of the same pass.
+"""
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+SELECTED_MARK = "☑"
+
+Box = Tuple[float, float, float, float]  # left, top, right, bottom as fractions of the page
+
+
+class PageParse(NamedTuple):
+    lines: List[str]
+    tables: List[List[List[str]]]
+    key_values: List[Tuple[str, str]]
+    boxes: Sequence[Box] = ()  # one per line
+
+
+def _box(block: Dict[str, Any]) -> Box:
+    bb = block.get("Geometry", {}).get("BoundingBox", {})
+    left, top = bb.get("Left", 0.0), bb.get("Top", 0.0)
+    return left, top, left + bb.get("Width", 0.0), top + bb.get("Height", 0.0)
+
+
+class BlockGraph:
+    __slots__ = ("blocks", "ordinal", "lines", "boxes", "tables_at", "keys_at")
+
+    def __init__(self, blocks: List[Dict[str, Any]]):
+        self.blocks = blocks
+        self.ordinal: Dict[str, int] = {}
+        self.lines: List[str] = []
+        self.boxes: List[Box] = []
+        self.tables_at: List[int] = []
+        self.keys_at: List[int] = []
+        ordinal = self.ordinal
+        for i, b in enumerate(blocks):
+            ordinal[b["Id"]] = i
+            t = b.get("BlockType")
+            if t == "LINE":
+                self.lines.append(b.get("Text", ""))
+                self.boxes.append(_box(b))
+            elif t == "TABLE":
+                self.tables_at.append(i)
+            elif t == "KEY_VALUE_SET" and "KEY" in b.get("EntityTypes", ()):
+                self.keys_at.append(i)
+
+    def __len__(self) -> int:
+        return len(self.blocks)
+
+    def related(self, i: int, rel_type: str = "CHILD") -> List[int]:
+        """Ordinals linked from block ``i`` by relationships of ``rel_type``."""
+        ordinal = self.ordinal
+        out: List[int] = []
+        for rel in self.blocks[i].get("Relationships", ()):
+            if rel.get("Type") != rel_type:
+                continue
+            for rid in rel.get("Ids", ()):
+                k = ordinal.get(rid)
+                if k is not None:
+                    out.append(k)
+        return out
+
+    def word_text(self, i: int) -> str:
+        """Words (and ticked checkboxes) directly under block ``i``."""
+        parts = []
+        blocks = self.blocks
+        for c in self.related(i):
+            b = blocks[c]
+            t = b.get("BlockType")
+            if t == "WORD":
+                parts.append(b.get("Text", ""))
+            elif t == "SELECTION_ELEMENT" and b.get("SelectionStatus") == "SELECTED":
+                parts.append(SELECTED_MARK)
+        return " ".join(parts).strip()
+
+    def table(self, i: int) -> List[List[str]]:
+        rows_map: Dict[int, Dict[int, str]] = {}
+        blocks = self.blocks
+        for c in self.related(i):
+            cell = blocks[c]
+            if cell.get("BlockType") != "CELL":
+                continue
+            rows_map.setdefault(cell.get("RowIndex", 0), {})[cell.get("ColumnIndex", 0)] = self.word_text(c)
+        if not rows_map:
+            return []
+        maxc = max((max(cols.keys()) for cols in rows_map.values()), default=0)
+        return [[rows_map[r].get(c, "") for c in range(1, maxc+1)] for r in sorted(rows_map.keys())]
+
+    def key_value(self, i: int) -> Tuple[str, str]:
+        values = self.related(i, "VALUE")
+        return self.word_text(i), self.word_text(values[-1]) if values else ""
+
+    def parse(self) -> PageParse:
+        tables = [t for t in (self.table(i) for i in self.tables_at) if t]
+        key_values = [kv for kv in (self.key_value(i) for i in self.keys_at) if kv[0]]
+        return PageParse(self.lines, tables, key_values, self.boxes)
+
+
+def parse_blocks(blocks: List[Dict[str, Any]]) -> PageParse:
+    return BlockGraph(blocks).parse()